@@ -1,7 +1,5 @@
 import argparse
 import os
-import shutil
-from tqdm import tqdm
 
 from play_store import GooglePlayStore
 import reader
@@ -15,6 +13,10 @@ def parse_arguments():
                         help='Path of the directory which contains raw sensors data.')
     parser.add_argument('-output', dest='outputDir', required=True,
                         help='Path of the directory where data will be stored.')
+    parser.add_argument('-workers', dest='workers', type=int, default=8,
+                        help='Number of concurrent requests to the Google Play Store (default: 8).')
+    parser.add_argument('-rate', dest='rate', type=float, default=10.0,
+                        help='Maximum number of requests per second to the Google Play Store (default: 10).')
 
     return parser.parse_args()
 
@@ -30,9 +32,8 @@ if __name__ == '__main__':
     main_dir = args.inputDir
     output_dir = args.outputDir
 
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir)
+    # The store of known apps is kept: only the stale or missing packages are fetched again
+    os.makedirs(output_dir, exist_ok=True)
 
     users_dirs = [dI for dI in os.listdir(main_dir) if os.path.isdir(os.path.join(main_dir, dI))]
 
@@ -42,7 +43,6 @@ if __name__ == '__main__':
     print("Reading both installed and running applications...")
     apps = reader.read_all_apps(main_dir, users_dirs)
 
-    for package in tqdm(apps, desc="Downloading apps categories"):
-        google.get_package_category(package)
+    google.fetch_categories(apps, workers=args.workers, rate=args.rate, progress=True)
 
-    print("Data saved in " + google.cache_file + " and " + google.app_categories_file)
\ No newline at end of file
+    print("Data saved in " + google.store_file + " and " + google.app_categories_file)
\ No newline at end of file
@@ -0,0 +1,185 @@
+#!venv/bin/python
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import reader
+from model import Example
+from features import get_sample_times
+from windows import window_features
+from play_store import GooglePlayStore
+from dataset_writer import open_writer
+from datasetcreator import print_data_to_file
+from synthetic_data import generate_user
+from utils import get_dataset_header, FEATURE_GROUP_NAMES
+
+'''
+Benchmark of the dataset creation on synthetic users (synthetic_data.py) of increasing duration. For every size, the
+stages below are timed, and their peak memory is measured (tracemalloc, on a second run so that the timings are not
+slowed down by the tracing):
+
+    reader.<get_*>      parsing of every stream file (rows: entries of the stream)
+    load_data           parsing of all the streams (rows: entries of all the streams)
+    examples            Example construction (window features included) at every sample time of every activity
+                        (rows: examples)
+    print_data_to_file  CSV writing of the valid examples (rows: examples written)
+'''
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description='Benchmark of the dataset creation on synthetic users.')
+
+    parser.add_argument('-hours', dest='hours', default='6,24,96',
+                        help='Durations of the synthetic users, comma separated (default: 6,24,96).')
+
+    parser.add_argument('-seed', dest='seed', type=int, default=1, help='Random seed (default: 1).')
+
+    parser.add_argument('-repeat', dest='repeat', type=int, default=1,
+                        help='Runs of every stage, the best time is reported (default: 1).')
+
+    parser.add_argument('-no_memory', dest='memory', action='store_false',
+                        help='Do not measure the peak memory of the stages.')
+
+    parser.add_argument('-tmp', dest='tmpDir', default=None,
+                        help='Directory of the synthetic users and datasets (default: a temporary directory).')
+
+    parser.add_argument('-out', dest='outputFile', default=None, help='JSON file with the results.')
+
+    args = parser.parse_args()
+
+    args.hours = [float(hours) for hours in args.hours.split(',')]
+
+    return args
+
+
+def measure(function, repeat=1, memory=True):
+    """ Returns (result, seconds, peak bytes) of function(): best time of repeat runs, and peak of the memory
+    allocated during one more traced run (None without memory).
+    """
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    peak = None
+
+    if memory:
+        tracemalloc.start()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return result, best, peak
+
+
+def build_examples(streams, activities):
+
+    examples = []
+
+    for activity in activities:
+        times = get_sample_times(activity)
+
+        for sample_time, window in zip(times.tolist(), window_features(times, streams).tolist()):
+            examples.append(Example(sample_time, activity[2], *streams, False, groups=FEATURE_GROUP_NAMES,
+                                    window=window))
+
+    return examples
+
+
+def write_examples(out_dir, header, examples):
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    with open_writer(out_dir, header) as writer:
+        print_data_to_file(writer, examples)
+
+
+def benchmark_user(work_dir, hours, seed=1, repeat=1, memory=True):
+
+    user_dir = work_dir + "/user_" + str(hours)
+    google_dir = work_dir + "/google_" + str(hours)
+
+    generate_user(user_dir, google_dir, hours, seed=seed)
+
+    google = GooglePlayStore(google_dir)
+    header = get_dataset_header(google, FEATURE_GROUP_NAMES)
+
+    results = []
+
+    def add_result(stage, rows, seconds, peak):
+        results.append({'hours': hours, 'stage': stage, 'rows': rows, 'seconds': seconds,
+                        'rows_per_second': rows / seconds if seconds > 0 else None, 'peak_bytes': peak})
+
+    for name, file, read, needs_google in reader.STREAMS:
+        args = (google, user_dir) if needs_google else (user_dir,)
+
+        series, seconds, peak = measure(lambda: read(*args), repeat, memory)
+        add_result("reader." + read.__name__, len(series), seconds, peak)
+
+    streams, seconds, peak = measure(lambda: reader.load_data(user_dir, google, groups=FEATURE_GROUP_NAMES), repeat,
+                                     memory)
+    add_result("load_data", sum(len(stream) for stream in streams if stream is not None), seconds, peak)
+
+    activities = reader.read_activities(user_dir)
+
+    examples, seconds, peak = measure(lambda: build_examples(streams, activities), repeat, memory)
+    add_result("examples", len(examples), seconds, peak)
+
+    examples = [example for example in examples if example.is_valid()]
+
+    _, seconds, peak = measure(lambda: write_examples(work_dir + "/dataset", header, examples), repeat, memory)
+    add_result("print_data_to_file", len(examples), seconds, peak)
+
+    return results
+
+
+def print_results(results):
+
+    print("%8s  %-40s %10s %10s %12s %10s" % ("hours", "stage", "rows", "seconds", "rows/sec", "peak MB"))
+
+    for result in results:
+        rate = "-" if result['rows_per_second'] is None else "%.0f" % result['rows_per_second']
+        peak = "-" if result['peak_bytes'] is None else "%.1f" % (result['peak_bytes'] / (1024 * 1024))
+
+        print("%8g  %-40s %10d %10.3f %12s %10s" % (result['hours'], result['stage'], result['rows'],
+                                                    result['seconds'], rate, peak))
+
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+
+    work_dir = args.tmpDir if args.tmpDir is not None else tempfile.mkdtemp(prefix="benchmark_")
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = []
+
+    try:
+        for hours in args.hours:
+            results.extend(benchmark_user(work_dir, hours, args.seed, args.repeat, args.memory))
+    finally:
+        if args.tmpDir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+
+    # ru_maxrss is in kilobytes on Linux
+    print("Peak RSS of the process: %.1f MB" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+    if args.outputFile is not None:
+        with open(args.outputFile, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import time
+
+DAY = 24 * 60 * 60
+
+
+class CategoryStore:
+    """ On-disk (SQLite) store of the Google Play Store genres of packages. Packages that were looked up but have no
+    known genre are stored too (negative results), so that they are not fetched again on every run. Every entry has a
+    timestamp: entries older than their TTL are reported as stale by is_fresh, and can be fetched again.
+
+    Lookups are indexed queries, nothing is loaded in memory up front. With readonly, an existing store is opened
+    without ever writing to it.
+    """
+
+    def __init__(self, file_name, ttl=180 * DAY, negative_ttl=30 * DAY, readonly=False):
+
+        self.file_name = file_name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        if readonly:
+            self.connection = sqlite3.connect('file:' + file_name + '?mode=ro', uri=True)
+        else:
+            self.connection = sqlite3.connect(file_name)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS packages "
+                                    "(package TEXT PRIMARY KEY, genres TEXT NOT NULL, fetched REAL NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+
+    def get(self, package):
+        """ Returns (genres, fetched) for a stored package (genres is an empty list for negative results), or None.
+        """
+
+        row = self.connection.execute("SELECT genres, fetched FROM packages WHERE package = ?", (package,)).fetchone()
+
+        if row is None:
+            return None
+
+        return split_genres(row[0]), row[1]
+
+    def get_genres(self, package):
+        """ Returns the list of genres of the package, or None if it is unknown (or a negative result).
+        """
+
+        entry = self.get(package)
+
+        if entry is None or len(entry[0]) == 0:
+            return None
+
+        return entry[0]
+
+    def is_fresh(self, package, now=None):
+
+        entry = self.get(package)
+
+        if entry is None:
+            return False
+
+        ttl = self.ttl if len(entry[0]) > 0 else self.negative_ttl
+
+        return (now or time.time()) - entry[1] <= ttl
+
+    def put_many(self, packages, fetched=None):
+        """ Stores the genres (an iterable, empty for negative results) of every package of the dict, in one
+        transaction.
+        """
+
+        fetched = fetched or time.time()
+
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO packages (package, genres, fetched) VALUES (?, ?, ?)",
+                                        [(package, join_genres(genres), fetched)
+                                         for package, genres in packages.items()])
+
+    def get_meta(self, key):
+
+        try:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        except sqlite3.OperationalError:
+            # Store created before the meta table
+            return None
+
+        return None if row is None else json.loads(row[0])
+
+    def imported_tsv(self):
+        """ Returns the fingerprint of the flat known apps file of the last import_tsv, or None.
+        """
+
+        return self.get_meta('imported_tsv')
+
+    def import_tsv(self, file_name, sep="\t"):
+        """ Imports a flat known apps file (package, genre, [genre, ...] per line), and records its fingerprint (see
+        tsv_fingerprint). Returns the number of packages.
+        """
+
+        packages = {}
+
+        with open(file_name) as f:
+            for line in f:
+                elements = line.strip().split(sep)
+
+                if len(elements[0]) > 0:
+                    packages[elements[0]] = elements[1:]
+
+        self.put_many(packages, os.path.getmtime(file_name))
+
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                    ('imported_tsv', json.dumps(tsv_fingerprint(file_name))))
+
+        return len(packages)
+
+    def fingerprint(self):
+        """ Changes whenever the content of the store changes.
+        """
+
+        return list(self.connection.execute("SELECT COUNT(*), MAX(fetched) FROM packages").fetchone())
+
+    def close(self):
+        self.connection.close()
+
+
+def tsv_fingerprint(file_name):
+    """ Size and modification time of a flat known apps file (None if it does not exist).
+    """
+
+    if not os.path.isfile(file_name):
+        return None
+
+    stat = os.stat(file_name)
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def join_genres(genres):
+    return "\t".join(genres)
+
+
+def split_genres(genres):
+
+    if len(genres) == 0:
+        return []
+
+    return genres.split("\t")
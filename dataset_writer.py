@@ -0,0 +1,363 @@
+import json
+import os
+import shutil
+import struct
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+'''
+Dataset output formats:
+
+    - csv:          data (header + one comma-separated line per example) and labels (one label per line)
+    - npy:          data.npy (rows x columns float matrix) and labels.npy (integer label codes), both written as they
+                    grow and ready to be memory-mapped (np.load(..., mmap_mode='r'))
+    - columnar:     data.columns/chunk-NNNNN.npz, one array per column (and _labels) for every chunk of rows, so that
+                    single columns can be read without loading the others
+
+The npy and columnar formats store the header, the label names (label code = index) and the dtype in data.json.
+Every writer appends to an existing dataset of the same format, as the csv output always did.
+'''
+
+FORMATS = ['csv', 'npy', 'columnar']
+
+DTYPES = ['float64', 'float32']
+
+
+def open_writer(out_dir, header, format='csv', dtype='float64'):
+
+    if format == 'npy':
+        return NpyWriter(out_dir, header, dtype)
+
+    if format == 'columnar':
+        return ColumnarWriter(out_dir, header, dtype)
+
+    return CsvWriter(out_dir, header)
+
+
+def remove_dataset(out_dir, format='csv'):
+
+    if format == 'npy':
+        files = ['data.npy', 'labels.npy', 'data.json']
+    elif format == 'columnar':
+        files = ['data.json']
+        shutil.rmtree(out_dir + "/" + ColumnarWriter.CHUNKS_DIR, ignore_errors=True)
+    else:
+        files = ['data', 'labels']
+
+    for file in files:
+        if os.path.exists(out_dir + "/" + file):
+            os.remove(out_dir + "/" + file)
+
+
+class CsvWriter:
+
+    def __init__(self, out_dir, header):
+
+        self.data_file = out_dir + "/" + "data"
+        self.labels_file = out_dir + "/" + "labels"
+
+        if not os.path.exists(self.data_file):
+            with open(self.data_file, 'w') as data:
+                data.write(header + "\n")
+
+        self.data = open(self.data_file, 'a+')
+        self.labels = open(self.labels_file, 'a+')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, rows, labels):
+
+        if isinstance(rows, np.ndarray):
+            rows = rows.tolist()
+
+        for row in rows:
+            self.data.write(','.join(str(x) for x in row) + "\n")
+
+        for label in labels:
+            self.labels.write(label + "\n")
+
+    def merge(self, shard_dir, normalizer=None):
+
+        if not os.path.exists(shard_dir + "/" + "data"):
+            return
+
+        with open(shard_dir + "/" + "data") as shard:
+            # Skip the header
+            shard.readline()
+
+            if normalizer is None:
+                shutil.copyfileobj(shard, self.data)
+
+            else:
+                # Only the normalized columns are parsed and formatted again
+                for lines in iter(lambda: shard.readlines(1 << 20), []):
+                    rows = [line.rstrip("\n").split(',') for line in lines]
+
+                    values = normalizer.scale([[float(row[i]) for i in normalizer.columns] for row in rows])
+
+                    for row, row_values in zip(rows, values.tolist()):
+                        for i, value in zip(normalizer.columns, row_values):
+                            row[i] = str(value)
+
+                        self.data.write(','.join(row) + "\n")
+
+        with open(shard_dir + "/" + "labels") as shard:
+            shutil.copyfileobj(shard, self.labels)
+
+    def close(self):
+        self.data.close()
+        self.labels.close()
+
+
+class BinaryWriter(ABC):
+    """ Common part of the npy and columnar writers: metadata (data.json) and label coding.
+    """
+
+    def __init__(self, out_dir, header, dtype):
+
+        self.meta_file = out_dir + "/" + "data.json"
+        self.columns = header.split(',')
+        self.dtype = np.dtype(dtype)
+
+        self.meta = {'header': self.columns, 'dtype': self.dtype.name, 'labels': [], 'rows': 0}
+
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file) as f:
+                meta = json.load(f)
+
+            if meta['header'] != self.columns or meta['dtype'] != self.dtype.name:
+                raise ValueError("Cannot append to " + self.meta_file + ": different header or dtype")
+
+            self.meta = meta
+
+        self.label_codes = {label: code for code, label in enumerate(self.meta['labels'])}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def encode_labels(self, labels):
+
+        codes = []
+
+        for label in labels:
+            if label not in self.label_codes:
+                self.label_codes[label] = len(self.meta['labels'])
+                self.meta['labels'].append(label)
+
+            codes.append(self.label_codes[label])
+
+        return np.array(codes, dtype=np.int32)
+
+    def matrix(self, rows):
+        return np.asarray(rows, dtype=self.dtype).reshape(-1, len(self.columns))
+
+    @abstractmethod
+    def write(self, rows, labels):
+        pass
+
+    @abstractmethod
+    def shard_chunks(self, shard_dir):
+        """ Yields (matrix, labels) for every chunk of a dataset written by the same kind of writer.
+        """
+
+    def merge(self, shard_dir, normalizer=None):
+
+        for matrix, labels in self.shard_chunks(shard_dir):
+
+            if normalizer is not None:
+                matrix = np.array(matrix, dtype=np.float64)
+                matrix[:, normalizer.columns] = normalizer.scale(matrix[:, normalizer.columns])
+
+            self.write(matrix, labels)
+
+    def close(self):
+
+        with open(self.meta_file, 'w') as f:
+            json.dump(self.meta, f)
+
+
+class NpyWriter(BinaryWriter):
+
+    def __init__(self, out_dir, header, dtype, chunk_rows=65536):
+
+        BinaryWriter.__init__(self, out_dir, header, dtype)
+
+        # Rows of a shard merged at once
+        self.chunk_rows = chunk_rows
+
+        self.data = NpyAppender(out_dir + "/" + "data.npy", self.dtype, len(self.columns))
+        self.labels = NpyAppender(out_dir + "/" + "labels.npy", np.int32)
+
+    def write(self, rows, labels):
+
+        matrix = self.matrix(rows)
+
+        self.data.append(matrix)
+        self.labels.append(self.encode_labels(labels))
+        self.meta['rows'] = self.meta['rows'] + len(matrix)
+
+    def shard_chunks(self, shard_dir):
+
+        if not os.path.exists(shard_dir + "/" + "data.json"):
+            return
+
+        with open(shard_dir + "/" + "data.json") as f:
+            names = json.load(f)['labels']
+
+        data = np.load(shard_dir + "/" + "data.npy", mmap_mode='r')
+        codes = np.load(shard_dir + "/" + "labels.npy", mmap_mode='r')
+
+        # Slices of the memory-mapped shard: only chunk_rows rows are read (and scaled) at once
+        for start in range(0, len(data), self.chunk_rows):
+            end = start + self.chunk_rows
+            yield data[start:end], [names[code] for code in codes[start:end].tolist()]
+
+    def close(self):
+
+        self.data.close()
+        self.labels.close()
+
+        BinaryWriter.close(self)
+
+
+class NpyAppender:
+    """ .npy file that grows as arrays are appended to it. The header has a fixed size and is rewritten with the
+    actual shape on close, so the rows are never held in memory.
+    """
+
+    HEADER_SIZE = 128
+
+    def __init__(self, file_name, dtype, width=None):
+
+        self.dtype = np.dtype(dtype)
+        self.width = width
+
+        # The header is rewritten on close: it must fit for any number of rows
+        self.header(np.iinfo(np.int64).max)
+
+        if os.path.exists(file_name):
+            self.file = open(file_name, 'r+b')
+
+            np.lib.format.read_magic(self.file)
+            shape, _, dtype = np.lib.format.read_array_header_1_0(self.file)
+
+            if self.file.tell() != NpyAppender.HEADER_SIZE or dtype != self.dtype or shape[1:] != self.row_shape():
+                raise ValueError("Cannot append to " + file_name)
+
+            self.rows = shape[0]
+            self.file.seek(0, os.SEEK_END)
+
+        else:
+            self.file = open(file_name, 'w+b')
+            self.rows = 0
+            self.file.write(self.header())
+
+    def row_shape(self):
+        return () if self.width is None else (self.width,)
+
+    def header(self, rows=None):
+
+        shape = (self.rows if rows is None else rows,) + self.row_shape()
+
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (np.lib.format.dtype_to_descr(self.dtype),
+                                                                            shape)
+
+        # Magic string and version (8 bytes), header length (2 bytes), header and newline
+        if 10 + len(header) + 1 > NpyAppender.HEADER_SIZE:
+            raise ValueError("The .npy header of dtype " + str(self.dtype) + " and shape " + str(shape) +
+                             " does not fit in " + str(NpyAppender.HEADER_SIZE) + " bytes")
+
+        header = header.ljust(NpyAppender.HEADER_SIZE - 10 - 1) + "\n"
+
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+    def append(self, array):
+
+        self.file.write(np.ascontiguousarray(array, dtype=self.dtype).tobytes())
+        self.rows = self.rows + len(array)
+
+    def close(self):
+
+        self.file.seek(0)
+        self.file.write(self.header())
+        self.file.close()
+
+
+class ColumnarWriter(BinaryWriter):
+
+    CHUNKS_DIR = 'data.columns'
+
+    def __init__(self, out_dir, header, dtype, chunk_rows=65536):
+
+        BinaryWriter.__init__(self, out_dir, header, dtype)
+
+        self.chunks_dir = out_dir + "/" + ColumnarWriter.CHUNKS_DIR
+        self.chunk_rows = chunk_rows
+
+        self.meta.setdefault('chunks', [])
+
+        if not os.path.isdir(self.chunks_dir):
+            os.makedirs(self.chunks_dir)
+
+        self.buffer = []
+        self.buffer_labels = []
+        self.buffer_rows = 0
+
+    def write(self, rows, labels):
+
+        matrix = self.matrix(rows)
+
+        self.buffer.append(matrix)
+        self.buffer_labels.append(self.encode_labels(labels))
+        self.buffer_rows = self.buffer_rows + len(matrix)
+
+        if self.buffer_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+
+        if self.buffer_rows == 0:
+            return
+
+        matrix = np.concatenate(self.buffer)
+        columns = {name: matrix[:, i] for i, name in enumerate(self.columns)}
+        columns['_labels'] = np.concatenate(self.buffer_labels)
+
+        chunk = "chunk-%05d.npz" % len(self.meta['chunks'])
+        np.savez(self.chunks_dir + "/" + chunk, **columns)
+
+        self.meta['chunks'].append({'file': chunk, 'rows': len(matrix)})
+        self.meta['rows'] = self.meta['rows'] + len(matrix)
+
+        self.buffer = []
+        self.buffer_labels = []
+        self.buffer_rows = 0
+
+    def shard_chunks(self, shard_dir):
+
+        if not os.path.exists(shard_dir + "/" + "data.json"):
+            return
+
+        with open(shard_dir + "/" + "data.json") as f:
+            meta = json.load(f)
+
+        for chunk in meta['chunks']:
+            with np.load(shard_dir + "/" + ColumnarWriter.CHUNKS_DIR + "/" + chunk['file']) as columns:
+                matrix = np.column_stack([columns[name] for name in meta['header']])
+                labels = [meta['labels'][code] for code in columns['_labels'].tolist()]
+
+            yield matrix, labels
+
+    def close(self):
+
+        self.flush()
+
+        BinaryWriter.close(self)
@@ -1,15 +1,90 @@
 #!venv/bin/python
 
 import argparse
+import cProfile
 import os
 import shutil
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from tqdm import tqdm
 
-from model import Example
+from model import DEFAULT_TOLERANCES, Example
+from features import DEFAULT_STEP, DEFAULT_TRIM, get_sample_times, get_union_times, build_feature_matrices
+from windows import window_features
+from time_features import DEFAULT_TZ
 import reader
 from play_store import GooglePlayStore
-from utils import get_dataset_header
+from dataset_writer import FORMATS, DTYPES, open_writer, remove_dataset
+import manifest
+from sensor_normalizer import SensorRanges, TrackingWriter
+from scaler import SCALER_FILE, Scaler, ScalingWriter
+from instrumentation import REPORT
+from utils import get_dataset_header, FEATURE_GROUP_NAMES, DEFAULT_FEATURE_GROUPS
+
+
+def feature_groups(value):
+
+    groups = [group.strip() for group in value.split(',') if group.strip()]
+
+    for group in groups:
+        if group not in FEATURE_GROUP_NAMES:
+            raise argparse.ArgumentTypeError("unknown feature group '" + group + "' (available: " +
+                                             ','.join(FEATURE_GROUP_NAMES) + ")")
+
+    return groups
+
+
+def sampling_steps(value):
+
+    try:
+        steps = sorted(set(int(step) for step in value.split(',') if step.strip()))
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid sampling steps '" + value + "'")
+
+    if len(steps) == 0 or steps[0] <= 0:
+        raise argparse.ArgumentTypeError("sampling steps must be positive millis")
+
+    return steps
+
+
+def trim_span(value):
+
+    try:
+        span = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid trim '" + value + "'")
+
+    if not 0 <= span < 0.5:
+        raise argparse.ArgumentTypeError("the trim must be in [0, 0.5)")
+
+    return span
+
+
+def tolerance(value):
+
+    try:
+        group, millis = value.split('=')
+        millis = None if millis == 'none' else int(millis)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid tolerance '" + value + "' (expected GROUP=MILLIS or GROUP=none)")
+
+    if group not in FEATURE_GROUP_NAMES:
+        raise argparse.ArgumentTypeError("unknown feature group '" + group + "'")
+
+    return group, millis
+
+
+def time_zone(value):
+
+    try:
+        ZoneInfo(value)
+    except (ValueError, ZoneInfoNotFoundError):
+        raise argparse.ArgumentTypeError("unknown time zone '" + value + "'")
+
+    return value
 
 
 def parse_arguments():
@@ -28,29 +103,381 @@ def parse_arguments():
     parser.add_argument('-norm', dest='normalize_data', required=True,
                         help='Normalize data or not (0/1)')
 
-    return parser.parse_args()
+    parser.add_argument('-batch', dest='batch', action='store_true',
+                        help='Build the feature matrix of each activity at once (vectorized as-of join).')
+
+    parser.add_argument('-jobs', '--jobs', dest='jobs', type=int, default=1,
+                        help='Number of processes used to parse the raw sensors data files, or to build the users '
+                             'datasets with -users (default: 1).')
+
+    parser.add_argument('-cache', dest='cache', action='store_true',
+                        help='Keep a binary cache of the parsed sensors data next to the raw data, and reuse it when '
+                             'the raw files did not change.')
+
+    parser.add_argument('-groups', dest='groups', type=feature_groups, default=DEFAULT_FEATURE_GROUPS,
+                        help='Comma-separated list of the feature groups to compute. Only the raw data files these '
+                             'groups need are parsed (default: ' + ','.join(DEFAULT_FEATURE_GROUPS) + '). The '
+                             'visible_cells group has no features: without it, the examples with no visible cells '
+                             'are kept.')
+
+    parser.add_argument('-tz', dest='tz', type=time_zone, default=DEFAULT_TZ,
+                        help='Time zone (IANA name, e.g. Europe/Rome) used to compute the time features '
+                             '(default: ' + DEFAULT_TZ + ').')
+
+    parser.add_argument('-format', '--format', dest='format', choices=FORMATS, default='csv',
+                        help='Output format: csv (data and labels text files), npy (memory-mappable data.npy and '
+                             'labels.npy) or columnar (chunks of one array per column). Default: csv.')
+
+    parser.add_argument('-dtype', dest='dtype', choices=DTYPES, default='float64',
+                        help='Type of the features in the npy and columnar formats (default: float64).')
+
+    parser.add_argument('-users', dest='users', action='store_true',
+                        help='The input directory contains one sub-directory per user: build all of them in parallel.')
+
+    parser.add_argument('-scaler', dest='scaler', default=None,
+                        help='With -norm 1, normalize the features with the scaler saved by a previous build (e.g. the '
+                             'training dataset ' + SCALER_FILE + '), instead of the default ranges and of the sensors '
+                             'ranges of this dataset.')
+
+    parser.add_argument('-incremental', dest='incremental', action='store_true',
+                        help='Keep a manifest of the processed activities in the output directory, and only compute '
+                             'the new ones (the dataset is rebuilt if the settings or the old activities changed).')
+
+    parser.add_argument('-report', dest='report', default=None,
+                        help='Write a JSON report of the build: wall and CPU time of every stage, rows parsed from '
+                             'every stream, examples generated and dropped for every activity, cache hit rates and '
+                             'peak memory.')
+
+    parser.add_argument('-profile', dest='profile', default=None,
+                        help='Dump the cProfile stats of the examples computation to this file (with -users, one file '
+                             'per user: <file>.<user>).')
+
+    parser.add_argument('-step', dest='steps', type=sampling_steps, default=[DEFAULT_STEP],
+                        help='Sampling step of the examples (millis, default: ' + str(DEFAULT_STEP) + '). With '
+                             'several comma-separated steps (e.g. 5000,30000,60000), one dataset per step is built in '
+                             'one pass, in the step_<millis> sub-directories of the output directory.')
+
+    parser.add_argument('-trim', dest='trim', type=trim_span, default=DEFAULT_TRIM,
+                        help='Span of every activity (fraction of its duration) that is not sampled at its beginning '
+                             'and at its end (default: ' + str(DEFAULT_TRIM) + ').')
 
+    parser.add_argument('-tolerance', dest='tolerances', type=tolerance, action='append', default=[],
+                        metavar='GROUP=MILLIS',
+                        help='Max age of the value of a feature group at a sample time (none: no limit), e.g. '
+                             'bt_scan=120000 (can be repeated). Defaults: ' +
+                             ', '.join(group + '=' + str(millis) for group, millis in DEFAULT_TOLERANCES.items()) +
+                             '; no limit for the other groups.')
 
-def print_data_to_file(outDir, examples, google):
+    args = parser.parse_args()
 
-    data_file = outDir + "/" + "data"
-    labels_file = outDir + "/" + "labels"
+    tolerances = dict(DEFAULT_TOLERANCES)
+    tolerances.update(args.tolerances)
+    args.tolerances = tolerances
 
-    if not os.path.exists(data_file):
-        with open(data_file, 'w') as data:
-            header = get_dataset_header(google)
-            data.write(header + "\n")
+    if args.incremental and len(args.steps) > 1:
+        parser.error("-incremental builds a single dataset: it cannot be used with several sampling steps")
 
-    with open(data_file, 'a+') as data, open(labels_file, 'a+') as labels:
-        for example in examples:
-            data.write(','.join(str(x) for x in example.get_features_vector()) + "\n")
-            labels.write(example.label + "\n")
+    return args
+
+
+def print_data_to_file(writer, examples):
+
+    writer.write([example.get_features_vector() for example in examples], [example.label for example in examples])
+
+
+def build_user_dataset(user_dir, writer, google, normalize, batch=False, jobs=1, cache=False,
+                       groups=DEFAULT_FEATURE_GROUPS, tz=DEFAULT_TZ, reasons=None, progress=True, activities=None,
+                       written=None, profile=None, step=DEFAULT_STEP, trim=DEFAULT_TRIM, tolerances=DEFAULT_TOLERANCES):
+    """ Writes the examples of the activities (all the user activities if None) and returns their number. The number
+    of rows of every activity is appended to written (a list of (activity, rows)), if given. With profile, the cProfile
+    stats of the examples computation are dumped to that file.
+    """
+
+    return build_user_datasets(user_dir, [writer], google, normalize, [step], batch=batch, jobs=jobs, cache=cache,
+                               groups=groups, tz=tz, reasons=[reasons], progress=progress, activities=activities,
+                               written=[written], profile=profile, trim=trim, tolerances=tolerances)[0]
+
+
+def build_user_datasets(user_dir, writers, google, normalize, steps, batch=False, jobs=1, cache=False,
+                        groups=DEFAULT_FEATURE_GROUPS, tz=DEFAULT_TZ, reasons=None, progress=True, activities=None,
+                        written=None, profile=None, trim=DEFAULT_TRIM, tolerances=DEFAULT_TOLERANCES):
+    """ build_user_dataset of several sampling steps in one pass: the examples sampled every steps[i] millis are
+    written to writers[i] (missing values counted in reasons[i], rows of the activities appended to written[i]). The
+    streams are loaded once, and the examples of the times shared by several steps are computed once. Returns the
+    number of examples of every step.
+    """
+
+    if reasons is None:
+        reasons = [None] * len(steps)
+
+    if activities is None:
+        activities = reader.read_activities(user_dir)
+
+    if len(activities) == 0:
+        return [0] * len(steps)
+
+    # audio_features, battery_features, activity_rec_data, bt_conn, bt_scans, current_events, visible_cells,
+    # display_status, location_data, weather_info, wifi_p2p, wifi, environment_data, motion_data,
+    # position_sensor_data, multimedia_data, running_apps, wifi_devices, bt_scan_devices
+    with REPORT.stage('load_data'):
+        streams = reader.load_data(user_dir, google, jobs=jobs, cache=cache, groups=groups)
+
+    user = os.path.basename(os.path.normpath(user_dir))
+
+    total_examples = [0] * len(steps)
+
+    profiler = None
+
+    if profile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    for activity in tqdm(activities, desc="Activities for user " + user_dir, disable=not progress):
+        label = activity[2]
+
+        # remove the trim (%) of the data at the beginning and end
+        times_list = [get_sample_times(activity, min_millis=step, span=trim) for step in steps]
+
+        if batch:
+            with REPORT.stage('examples'):
+                results = build_feature_matrices(times_list, streams, normalize, groups, reasons, tz, tolerances)
+
+            with REPORT.stage('write'):
+                for writer, (times, matrix) in zip(writers, results):
+                    writer.write(matrix, [label] * len(times))
+
+            rows_list = [len(times) for times, _ in results]
+
+        else:
+            with REPORT.stage('examples'):
+                times, positions = get_union_times(times_list)
+
+                windows = [None] * len(times)
+                if 'window' in groups:
+                    windows = window_features(times, streams).tolist()
+
+                examples = [Example(time, label, *streams, normalize, groups=groups, tz=tz, tolerances=tolerances,
+                                    window=window)
+                            for time, window in zip(times.tolist(), windows)]
+
+                examples_list = [[examples[i] for i in position.tolist() if examples[i].is_valid(step_reasons)]
+                                 for position, step_reasons in zip(positions, reasons)]
+
+            with REPORT.stage('write'):
+                for writer, step_examples in zip(writers, examples_list):
+                    print_data_to_file(writer, step_examples)
+
+            rows_list = [len(step_examples) for step_examples in examples_list]
+
+        for i, rows in enumerate(rows_list):
+            total_examples[i] = total_examples[i] + rows
+
+            REPORT.add_activity(user, activity, len(times_list[i]), rows, steps[i])
+
+            if written is not None and written[i] is not None:
+                written[i].append((activity, rows))
+
+        #print(label + ": " + str(len(examples)) + " - " + str((activity[1]-activity[0])/(1000*60)) + "min")
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(profile)
+
+    return total_examples
+
+
+'''=====================================================================================================================
+MULTI-USER BUILD
+====================================================================================================================='''
+
+# GooglePlayStore instance of a worker process, loaded once by init_worker
+worker_google = None
+
+
+def init_worker(google):
+
+    global worker_google
+    worker_google = google
+
+
+def build_user_shard(user_dir, shard_dirs, normalize, batch, cache, groups, tz, format, dtype, activities=None,
+                     scaler=None, profile=None, steps=(DEFAULT_STEP,), trim=DEFAULT_TRIM,
+                     tolerances=DEFAULT_TOLERANCES):
+    """ Writes the dataset of every sampling step of the user to its shard (shard_dirs[i] for steps[i]).
+    """
+
+    # Report of this user only, sent back to the main process
+    REPORT.reset()
+
+    for shard_dir in shard_dirs:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        os.makedirs(shard_dir)
+
+    reasons = [Counter() for _ in steps]
+    written = [[] for _ in steps]
+
+    header = get_dataset_header(worker_google, groups)
+    ranges = [SensorRanges(header) for _ in steps]
+
+    with ExitStack() as stack:
+        writers = []
+
+        for shard_dir, step_ranges in zip(shard_dirs, ranges):
+            writer = open_writer(shard_dir, header, format, dtype)
+
+            if scaler is not None:
+                writer = ScalingWriter(writer, scaler)
+
+            writers.append(stack.enter_context(TrackingWriter(writer, step_ranges)))
+
+        total_examples = build_user_datasets(user_dir, writers, worker_google, normalize, steps, batch=batch,
+                                             cache=cache, groups=groups, tz=tz, reasons=reasons, progress=False,
+                                             activities=activities, written=written, profile=profile, trim=trim,
+                                             tolerances=tolerances)
+
+    return total_examples, reasons, written, ranges, REPORT
+
+
+def merge_shards(output_dir, shard_dirs, header, format='csv', dtype='float64', append=False, normalizer=None):
+    """ Concatenates the shards, in the given order, into the dataset of output_dir (replaced, unless append). The
+    sensors features are rescaled with normalizer (SensorRanges), if given.
+    """
+
+    if not append:
+        remove_dataset(output_dir, format)
+
+    with REPORT.stage('merge'), open_writer(output_dir, header, format, dtype) as writer:
+        for shard_dir in shard_dirs:
+            writer.merge(shard_dir, normalizer)
+
+
+def build_users_dataset(main_dir, users_dirs, output_dirs, google, normalize, batch=False, jobs=1, cache=False,
+                        groups=DEFAULT_FEATURE_GROUPS, tz=DEFAULT_TZ, format='csv', dtype='float64', reasons=None,
+                        activities=None, written=None, scaler=None, ranges=None, profile=None, steps=(DEFAULT_STEP,),
+                        trim=DEFAULT_TRIM, tolerances=DEFAULT_TOLERANCES):
+    """ Builds the dataset of every user directory in main_dir on a pool of processes, with every sampling step
+    (steps[i] to output_dirs[i]). Each user is written to its own shard, then the shards are merged in the order of
+    users_dirs. With activities ({user: activities}), only those activities are computed and appended to the dataset,
+    and the rows of every activity are stored in written[i] ({user: list of (activity, rows)}). Rows are scaled with
+    scaler (scaler.Scaler) as they are written, and their sensors features are rescaled with ranges[i] (SensorRanges,
+    extended with the ranges of the new rows) when the shards are merged. With profile, the cProfile stats of every
+    user are dumped to profile.<user>. Returns the number of examples of every step.
+    """
+
+    header = get_dataset_header(google, groups)
+
+    if activities is not None:
+        users_dirs = [user for user in users_dirs if len(activities[user]) > 0]
+
+    shard_dirs = {user: [output_dir + "/" + "shards" + "/" + user for output_dir in output_dirs] for user in users_dirs}
+
+    total_examples = [0] * len(steps)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(google,)) as executor:
+        futures = {executor.submit(build_user_shard, main_dir + "/" + user, shard_dirs[user], normalize, batch, cache,
+                                   groups, tz, format, dtype, None if activities is None else activities[user],
+                                   scaler, None if profile is None else profile + "." + user, steps, trim,
+                                   tolerances): user
+                   for user in users_dirs}
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Users"):
+            user_examples, user_reasons, user_written, user_ranges, user_report = future.result()
+
+            REPORT.merge(user_report)
+
+            for i in range(len(steps)):
+                total_examples[i] = total_examples[i] + user_examples[i]
+                if ranges is not None and ranges[i] is not None:
+                    ranges[i].merge(user_ranges[i])
+                if reasons is not None:
+                    reasons[i].update(user_reasons[i])
+                if written is not None:
+                    written[i][futures[future]] = user_written[i]
+
+    for i, output_dir in enumerate(output_dirs):
+        merge_shards(output_dir, [shard_dirs[user][i] for user in users_dirs], header, format, dtype,
+                     append=activities is not None, normalizer=None if ranges is None else ranges[i])
+
+        shutil.rmtree(output_dir + "/" + "shards", ignore_errors=True)
+
+    return total_examples
 
 
 '''=====================================================================================================================
 MAIN
 ====================================================================================================================='''
 
+
+def get_output_dirs(output_dir, steps):
+    """ Returns the dataset directory of every sampling step: the output directory itself with a single step, a
+    step_<millis> sub-directory of it for every step otherwise.
+    """
+
+    if len(steps) == 1:
+        return [output_dir]
+
+    return [output_dir + "/" + "step_" + str(step) for step in steps]
+
+
+def build_output(args, google, normalize, header, users_dirs, activities, written, scaler, ranges, reasons):
+    """ Builds the datasets of the command line arguments, one for every sampling step (only the given activities, if
+    not None) and returns their number of examples. written, ranges and reasons have one element per step. Rows are
+    scaled with scaler and ranges, if not None (see build_users_dataset).
+    """
+
+    output_dirs = get_output_dirs(args.outputDir, args.steps)
+
+    if args.users:
+        return build_users_dataset(args.inputDir, users_dirs, output_dirs, google, normalize, batch=args.batch,
+                                   jobs=args.jobs, cache=args.cache, groups=args.groups, tz=args.tz,
+                                   format=args.format, dtype=args.dtype, reasons=reasons, activities=activities,
+                                   written=written, scaler=scaler, ranges=ranges, profile=args.profile,
+                                   steps=args.steps, trim=args.trim, tolerances=args.tolerances)
+
+    user = users_dirs[0]
+
+    # The sensors features are rescaled when the rows are copied to the dataset, once their ranges are known
+    shard_dirs = [None] * len(output_dirs)
+
+    with ExitStack() as stack:
+        writers = []
+
+        for i, output_dir in enumerate(output_dirs):
+            written[i][user] = []
+
+            if ranges[i] is not None:
+                shard_dirs[i] = output_dir + "/" + "shards" + "/" + user
+                shutil.rmtree(shard_dirs[i], ignore_errors=True)
+                os.makedirs(shard_dirs[i])
+
+                writer = open_writer(shard_dirs[i], header, args.format, args.dtype)
+            else:
+                writer = open_writer(output_dir, header, args.format, args.dtype)
+
+            if scaler is not None:
+                writer = ScalingWriter(writer, scaler)
+
+            if ranges[i] is not None:
+                writer = TrackingWriter(writer, ranges[i])
+
+            writers.append(stack.enter_context(writer))
+
+        total_examples = build_user_datasets(args.inputDir, writers, google, normalize, args.steps, batch=args.batch,
+                                             jobs=args.jobs, cache=args.cache, groups=args.groups, tz=args.tz,
+                                             reasons=reasons,
+                                             activities=None if activities is None else activities[user],
+                                             written=[step_written[user] for step_written in written],
+                                             profile=args.profile, trim=args.trim, tolerances=args.tolerances)
+
+    for i, output_dir in enumerate(output_dirs):
+        if shard_dirs[i] is not None:
+            merge_shards(output_dir, [shard_dirs[i]], header, args.format, args.dtype, append=True,
+                         normalizer=ranges[i])
+            shutil.rmtree(output_dir + "/" + "shards", ignore_errors=True)
+
+    return total_examples
+
+
 if __name__ == '__main__':
 
     args = parse_arguments()
@@ -63,56 +490,127 @@ if __name__ == '__main__':
     if args.normalize_data == "1":
         normalize = True
 
-    if not os.path.isdir(output_dir):
-        #shutil.rmtree(output_dir, ignore_errors=True)
-        os.makedirs(output_dir)
+    output_dirs = get_output_dirs(output_dir, args.steps)
+
+    for step_dir in output_dirs:
+        if not os.path.isdir(step_dir):
+            #shutil.rmtree(output_dir, ignore_errors=True)
+            os.makedirs(step_dir)
 
-    users_dirs = [dI for dI in os.listdir(main_dir) if os.path.isdir(os.path.join(main_dir, dI))]
+    users_dirs = sorted(dI for dI in os.listdir(main_dir) if os.path.isdir(os.path.join(main_dir, dI)))
 
     google = GooglePlayStore(google_dir)
 
-    user_dir = args.inputDir
+    # One element per sampling step (a single one with -incremental)
+    invalid_reasons = [Counter() for _ in args.steps]
 
-    activities = reader.read_activities(user_dir)
+    header = get_dataset_header(google, args.groups)
 
-    audio_features, battery_features, activity_rec_data, bt_conn, bt_scans, current_events, visible_cells,\
-        display_status, location_data, weather_info, wifi_p2p, wifi, environment_data, motion_data,\
-        position_sensor_data, multimedia_data, running_apps = reader.load_data(user_dir, google, normalize)
+    if not args.users:
+        users_dirs = [os.path.basename(os.path.normpath(main_dir))]
 
-    total_examples = 0
+    # Activities to compute, by user (None: all of them)
+    activities = None
+    written = [{} for _ in args.steps]
 
-    for activity in tqdm(activities, desc="Activities for user " + user_dir):
-        start = activity[0]
-        end = activity[1]
-        label = activity[2]
+    # Normalization: default (or saved) scaling of the rows, and ranges of the sensors features fitted on the dataset
+    scaler = None
+    ranges = [None for _ in args.steps]
+
+    if normalize:
+        if args.scaler is not None:
+            scaler = Scaler.load(args.scaler, header)
+        else:
+            scaler = Scaler.default(header)
+
+            if len(SensorRanges(header)) > 0:
+                ranges = [SensorRanges(header) for _ in args.steps]
+
+    if args.incremental:
+        if args.users:
+            users_activities = {user: reader.read_activities(main_dir + "/" + user) for user in users_dirs}
+        else:
+            users_activities = {users_dirs[0]: reader.read_activities(main_dir)}
+
+        config = {'header': header, 'normalize': normalize, 'groups': args.groups, 'tz': args.tz,
+                  'format': args.format, 'dtype': args.dtype, 'scaler': None if args.scaler is None else scaler.params,
+                  'step': args.steps[0], 'trim': args.trim, 'tolerances': args.tolerances}
+
+        build_manifest = manifest.load_manifest(output_dir)
+
+        if not manifest.is_reusable(build_manifest, config, users_activities):
+            if build_manifest is not None:
+                print("Settings or activities changed: rebuilding the dataset")
+            remove_dataset(output_dir, args.format)
+            build_manifest = manifest.new_manifest(config)
+
+        activities = {user: manifest.new_activities(build_manifest, user, users_activities[user])
+                      for user in users_dirs}
+        if ranges[0] is not None:
+            ranges = [SensorRanges(header, build_manifest.get('sensor_ranges'))]
+
+        print("New activities: " + str(sum(len(user_activities) for user_activities in activities.values())))
+
+        build_manifest['complete'] = False
+        manifest.save_manifest(output_dir, build_manifest)
+
+    else:
+        # The rows appended by this build are not tracked
+        for step_dir in output_dirs:
+            manifest.remove_manifest(step_dir)
+
+    total_examples = build_output(args, google, normalize, header, users_dirs, activities, written, scaler, ranges,
+                                  invalid_reasons)
+
+    if args.incremental:
+
+        # Rows already written were rescaled with the old sensors ranges
+        if ranges[0] is not None and build_manifest['rows'] > 0 and \
+                ranges[0].to_dict() != build_manifest.get('sensor_ranges'):
+            print("Sensors ranges changed: rebuilding the dataset")
+
+            remove_dataset(output_dir, args.format)
+            build_manifest = manifest.new_manifest(config)
+            build_manifest['complete'] = False
+            manifest.save_manifest(output_dir, build_manifest)
 
-        # remove the 10% of the data at the beginning and end
-        span = 0.1
-        start = start + int((end-start) * span)
-        end = end - int((end-start) * span)
+            written = [{}]
+            ranges = [SensorRanges(header)]
+            invalid_reasons = [Counter()]
 
-        time = start
+            total_examples = build_output(args, google, normalize, header, users_dirs, users_activities, written,
+                                          scaler, ranges, invalid_reasons)
 
-        min_millis = 60000
+        # Rows are appended in the order of users_dirs
+        for user in users_dirs:
+            for activity, rows in written[0].get(user, []):
+                manifest.add_activity(build_manifest, user, activity, rows)
 
-        examples = []
+        if ranges[0] is not None:
+            build_manifest['sensor_ranges'] = ranges[0].to_dict()
+        build_manifest['complete'] = True
+        manifest.save_manifest(output_dir, build_manifest)
 
-        while time <= end:
+    for i, step_dir in enumerate(output_dirs):
 
-            example = Example(time, label, audio_features, battery_features, activity_rec_data, bt_conn, bt_scans,
-                              current_events, visible_cells, display_status, location_data, weather_info, wifi_p2p,
-                              wifi, environment_data, motion_data, position_sensor_data, multimedia_data,
-                              running_apps, normalize)
+        if scaler is not None:
+            step_scaler = Scaler(header, scaler.params)
 
-            if example.is_valid():
-                examples.append(example)
+            if ranges[i] is not None:
+                step_scaler.fit_sensors(ranges[i])
 
-            time = time + min_millis
+            step_scaler.save(step_dir + "/" + SCALER_FILE)
 
-        print_data_to_file(output_dir, examples, google)
+        prefix = "" if len(args.steps) == 1 else "Step " + str(args.steps[i]) + " - "
 
-        total_examples = total_examples + len(examples)
+        print(prefix + "Total examples: " + str(total_examples[i]))
 
-    print("Total examples: "+str(total_examples))
+        if len(invalid_reasons[i]) > 0:
+            print(prefix + "Dropped examples, by missing value: " +
+                  ", ".join(field + ": " + str(count) for field, count in invalid_reasons[i].most_common()))
 
-        #print(label + ": " + str(len(examples)) + " - " + str((activity[1]-activity[0])/(1000*60)) + "min")
\ No newline at end of file
+    if args.report is not None:
+        if len(args.steps) == 1:
+            REPORT.save(args.report, invalid_reasons[0])
+        else:
+            REPORT.save(args.report, {str(step): dict(reasons) for step, reasons in zip(args.steps, invalid_reasons)})
@@ -0,0 +1,156 @@
+import numpy as np
+
+from time_features import DEFAULT_TZ, get_time_matrix
+from utils import DEFAULT_FEATURE_GROUPS, TIME_HEADER
+from windows import window_features
+from model import DEFAULT_TOLERANCES, DISPLAY_ON_WINDOW, EMPTY_BT_SCAN, EMPTY_WIFI, is_display_on, bt_conn_features,\
+    calendar_features, location_features, weather_features, wifi_p2p_features
+
+'''
+Batch engine: builds the feature matrix of a whole activity (or user) at once. Every stream is joined with the array of
+sample times through a single vectorized as-of lookup, so the result matches one Example per sample time, but without
+any per-example Python object.
+
+Several sampling steps (multi-resolution) are computed at once on the union of their sample times: every stream is
+looked up, and every feature row built, only once per distinct time, and each step then takes its own rows.
+'''
+
+# Default sampling step (millis) and span (%) of every activity trimmed at the beginning and end
+DEFAULT_STEP = 60000
+DEFAULT_TRIM = 0.1
+
+
+def get_sample_times(activity, min_millis=DEFAULT_STEP, span=DEFAULT_TRIM):
+    """ Returns the sample times of an activity, after removing the span (%) of data at the beginning and end.
+    """
+
+    start = activity[0]
+    end = activity[1]
+
+    start = start + int((end - start) * span)
+    end = end - int((end - start) * span)
+
+    return np.arange(start, end + 1, min_millis, dtype=np.int64)
+
+
+def get_union_times(times_list):
+    """ Returns (times, positions): the sorted union of the arrays of sample times, and the positions of the elements
+    of every array in the union.
+    """
+
+    if len(times_list) == 1:
+        return times_list[0], [np.arange(len(times_list[0]))]
+
+    times = np.unique(np.concatenate(times_list))
+
+    return times, [np.searchsorted(times, step_times) for step_times in times_list]
+
+
+def build_feature_matrix(times, streams, normalize, groups=DEFAULT_FEATURE_GROUPS, reasons=None, tz=DEFAULT_TZ,
+                         tolerances=DEFAULT_TOLERANCES):
+    """ Returns (times, matrix): the subset of sample times that produce a valid example and the matching feature
+    matrix, one row per time with the same columns as Example.get_features_vector. Missing values are counted in
+    reasons (a Counter, see Example.is_valid), if given.
+    """
+
+    return build_feature_matrices([times], streams, normalize, groups, [reasons], tz, tolerances)[0]
+
+
+def build_feature_matrices(times_list, streams, normalize, groups=DEFAULT_FEATURE_GROUPS, reasons_list=None,
+                           tz=DEFAULT_TZ, tolerances=DEFAULT_TOLERANCES):
+    """ build_feature_matrix of several arrays of sample times (e.g. the sample times of several steps) at once:
+    returns one (times, matrix) for every array. The missing values of every array are counted in the matching Counter
+    of reasons_list, if given.
+    """
+
+    audio_features, battery_features, activity_rec_data, bt_conn, bt_scans, current_events, visible_cells,\
+        display_status, location_data, weather_info, wifi_p2p, wifi, environment_data, motion_data,\
+        position_sensor_data, multimedia_data, running_apps, _, _ = streams
+
+    # (group, stream, default, encoder), in the order of Example.get_features_vector. A None default means that the
+    # example is not valid without the stream value, a None encoder that the values already are feature rows.
+    lookups = [
+        ('audio', audio_features, None, list),
+        ('display', display_status, None, list),
+        ('battery', battery_features, None, list),
+        ('activity_rec', activity_rec_data, None, list),
+        ('running_apps', running_apps, None, None),
+        ('bt_conn', bt_conn, None, bt_conn_features),
+        ('bt_scan', bt_scans, EMPTY_BT_SCAN, None),
+        ('calendar', current_events, [], calendar_features),
+        ('multimedia', multimedia_data, 0, scalar_features),
+        ('location', location_data, None, location_features),
+        ('weather', weather_info, None, weather_features),
+        ('wifi_p2p', wifi_p2p, [], wifi_p2p_features),
+        ('wifi', wifi, EMPTY_WIFI, None),
+        ('environment_sensors', environment_data, None, None),
+        ('motion_sensors', motion_data, None, None),
+        ('position_sensors', position_sensor_data, None, None),
+    ]
+
+    lookups = [lookup for lookup in lookups if lookup[0] in groups]
+
+    times, positions = get_union_times(times_list)
+
+    indices = [stream.indices_at(times, tolerances.get(group)) for group, stream, _, _ in lookups]
+
+    # Required values, by feature group
+    present = [(group, idx >= 0) for idx, (group, _, default, _) in zip(indices, lookups) if default is None]
+
+    # Visible cells do not contribute any feature: they are only checked
+    if 'visible_cells' in groups:
+        present.append(('visible_cells', visible_cells.indices_at(times, tolerances.get('visible_cells')) >= 0))
+
+    valid = np.ones(len(times), dtype=bool)
+    for _, mask in present:
+        valid &= mask
+
+    if reasons_list is not None:
+        for reasons, position in zip(reasons_list, positions):
+            if reasons is None:
+                continue
+
+            for field, mask in present:
+                missing = int(len(position) - mask[position].sum())
+                if missing > 0:
+                    reasons[field] += missing
+
+    valid_times = times[valid]
+
+    if len(valid_times) == 0:
+        return [(valid_times, np.empty((0, 0))) for _ in positions]
+
+    blocks = []
+
+    if 'time' in groups:
+        blocks.append(get_time_matrix(valid_times, normalize, TIME_HEADER, tz))
+
+    for idx, (group, stream, default, encoder) in zip(indices, lookups):
+        blocks.append(stream.gather(idx[valid], encoder, default))
+
+        if group == 'display':
+            counts = display_status.count_in_window(valid_times, DISPLAY_ON_WINDOW, is_display_on)
+            blocks.append(counts.astype(np.float64).reshape(-1, 1))
+
+    if 'window' in groups:
+        blocks.append(window_features(valid_times, streams))
+
+    matrix = np.hstack(blocks)
+
+    if len(times_list) == 1:
+        return [(valid_times, matrix)]
+
+    # Row of every valid time in the matrix
+    rows = np.cumsum(valid) - 1
+
+    results = []
+
+    for position in positions:
+        position = position[valid[position]]
+        results.append((times[position], matrix[rows[position]]))
+
+    return results
+
+
+def scalar_features(value):
+    return [value]
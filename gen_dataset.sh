@@ -5,11 +5,8 @@ if [ "$#" -ne "4" ]; then
 	exit 1
 fi
 
+# With NORMALIZE=1 the sensors data is also rescaled by datasetcreator.py
 ./datasetcreator.py -in $1 -out ../output -google ../google_cache -norm $4
 
-if [ "$4" -eq "1" ]; then
-	echo "Normalizing raw sensors data"
-	./normalize_sensors_data.R ../output/data $2
-fi
-
-mv ../output/label $3
+mv ../output/data $2
+mv ../output/labels $3
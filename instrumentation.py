@@ -0,0 +1,127 @@
+import json
+import resource
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+'''
+Instrumentation of a dataset build, saved as a JSON report (datasetcreator.py -report):
+
+    {
+        "stages":     {stage: {"calls", "wall", "cpu"}}            (seconds, summed over all the calls)
+        "streams":    {stream: {"reads", "cached", "rows", "wall", "cpu"}}
+        "activities": [{"user", "start", "end", "label", "step", "samples", "examples", "dropped"}]
+        "counters":   {counter: value}                            (e.g. stream cache and Play Store lookups)
+        "hit_rates":  {cache: hits / lookups}
+        "invalid":    {reason: examples}
+        "peak_rss":   {"self", "children"}                        (bytes)
+    }
+
+The instrumented modules record in the REPORT of their process. Worker processes send theirs back with their results,
+and they are merged into the REPORT of the main process.
+'''
+
+# Caches: (hits counters, misses counters)
+HIT_RATES = {
+    'stream_cache': (['stream_cache_hits'], ['stream_cache_misses']),
+    'play_store': (['play_store_memo_hits', 'play_store_store_hits'],
+                   ['play_store_store_misses', 'play_store_fetches']),
+}
+
+
+class BuildReport:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+
+        self.stages = {}
+        self.streams = {}
+        self.activities = []
+        self.counters = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        """ Adds the wall and CPU (of this process) time of the block to the stage.
+        """
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add_stage(self, name, wall, cpu, calls=1):
+
+        stage = self.stages.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+        stage['calls'] = stage['calls'] + calls
+        stage['wall'] = stage['wall'] + wall
+        stage['cpu'] = stage['cpu'] + cpu
+
+    def add_stream(self, name, rows, wall, cpu, cached=0, reads=1):
+        """ Adds reads of the stream, cached of them loaded from the stream cache.
+        """
+
+        stream = self.streams.setdefault(name, {'reads': 0, 'cached': 0, 'rows': 0, 'wall': 0.0, 'cpu': 0.0})
+        stream['reads'] = stream['reads'] + reads
+        stream['cached'] = stream['cached'] + cached
+        stream['rows'] = stream['rows'] + rows
+        stream['wall'] = stream['wall'] + wall
+        stream['cpu'] = stream['cpu'] + cpu
+
+    def add_activity(self, user, activity, samples, examples, step=None):
+
+        self.activities.append({'user': user, 'start': activity[0], 'end': activity[1], 'label': activity[2],
+                                'step': step, 'samples': samples, 'examples': examples,
+                                'dropped': samples - examples})
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def merge(self, other):
+
+        for name, stage in other.stages.items():
+            self.add_stage(name, stage['wall'], stage['cpu'], stage['calls'])
+
+        for name, stream in other.streams.items():
+            self.add_stream(name, stream['rows'], stream['wall'], stream['cpu'], stream['cached'], stream['reads'])
+
+        self.activities.extend(other.activities)
+        self.counters.update(other.counters)
+
+    def hit_rates(self):
+
+        rates = {}
+
+        for cache, (hits, misses) in HIT_RATES.items():
+            hit_count = sum(self.counters[name] for name in hits)
+            lookups = hit_count + sum(self.counters[name] for name in misses)
+
+            rates[cache] = hit_count / lookups if lookups > 0 else None
+
+        return rates
+
+    def to_dict(self, invalid=None):
+
+        # ru_maxrss is in kilobytes on Linux; children: largest of the terminated worker processes
+        return {
+            'stages': self.stages,
+            'streams': self.streams,
+            'activities': self.activities,
+            'counters': dict(self.counters),
+            'hit_rates': self.hit_rates(),
+            'invalid': dict(invalid or {}),
+            'peak_rss': {'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                         'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024},
+        }
+
+    def save(self, file_name, invalid=None):
+
+        with open(file_name, 'w') as f:
+            json.dump(self.to_dict(invalid), f, indent=2)
+
+
+REPORT = BuildReport()
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+
+'''
+Manifest of an incrementally built dataset (manifest.json, in the output directory):
+
+    {
+        "config":   hash of the build settings the rows depend on,
+        "complete": false while a build is writing rows,
+        "rows":     number of rows of the dataset,
+        "users":    {user: [[start, end, label, first_row, end_row], ...]}
+    }
+
+Every processed activity (start, end, label) of every user is listed with the range of dataset rows it produced
+(end_row excluded; activities without valid examples have an empty range). New activities are appended to the dataset
+as they are found. The dataset is rebuilt from scratch if the settings changed, if an activity that was processed is
+no longer in the user activities (removed or changed) or if the previous build did not complete.
+'''
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def config_hash(config):
+
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def new_manifest(config):
+
+    return {'config': config_hash(config), 'complete': True, 'rows': 0, 'users': {}}
+
+
+def load_manifest(out_dir):
+
+    try:
+        with open(out_dir + "/" + MANIFEST_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(out_dir, manifest):
+
+    tmp_file = out_dir + "/" + MANIFEST_FILE + ".tmp"
+
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f)
+
+    os.replace(tmp_file, out_dir + "/" + MANIFEST_FILE)
+
+
+def remove_manifest(out_dir):
+
+    if os.path.exists(out_dir + "/" + MANIFEST_FILE):
+        os.remove(out_dir + "/" + MANIFEST_FILE)
+
+
+def processed_activities(manifest, user):
+
+    return set((start, end, label) for start, end, label, _, _ in manifest['users'].get(user, []))
+
+
+def is_reusable(manifest, config, users_activities):
+    """ Returns True if the rows of the manifest can be kept: same settings, complete build, and every processed
+    activity still among users_activities ({user: list of (start, end, label)}).
+    """
+
+    if manifest is None or manifest['config'] != config_hash(config) or not manifest['complete']:
+        return False
+
+    for user in manifest['users']:
+        if user not in users_activities or not processed_activities(manifest, user).issubset(users_activities[user]):
+            return False
+
+    return True
+
+
+def new_activities(manifest, user, activities):
+
+    processed = processed_activities(manifest, user)
+
+    return [activity for activity in activities if tuple(activity) not in processed]
+
+
+def add_activity(manifest, user, activity, rows):
+
+    start, end, label = activity
+
+    manifest['users'].setdefault(user, []).append([start, end, label, manifest['rows'], manifest['rows'] + rows])
+    manifest['rows'] = manifest['rows'] + rows
@@ -1,254 +1,313 @@
-from datetime import datetime
-import calendar
-from math import ceil
+import numpy as np
 
+from time_features import DEFAULT_TZ, get_time_features
+from utils import DEFAULT_FEATURE_GROUPS, TIME_HEADER, BT_SCAN_HEADER, WIFI_HEADER
 
-class Example:
-    
-    def __init__(self, time, label, audio_features, battery_features, activity_rec_data, bt_conn, bt_scans,
-                 current_events, visible_cells, display_status, location_data, weather_info, wifi_p2p, wifi,
-                 environment_data, motion_data, position_sensor_data, multimedia_data, running_apps, normalize):
-
-        min_millis = 60000
 
-        self.audio = Example.get_nearest_example(time, audio_features, None)
+# Bits of Example.missing: values an example is not valid without, by feature group (or stream, for visible cells)
+REQUIRED_FIELDS = {name: 1 << bit for bit, name in enumerate([
+    'audio', 'battery', 'activity_rec', 'running_apps', 'bt_conn', 'visible_cells', 'display', 'location', 'weather',
+    'environment_sensors', 'motion_sensors', 'position_sensors'])}
 
-        self.battery = Example.get_nearest_example(time, battery_features, None)
+# Max age (millis) of the value of a stream at a sample time, by feature group (or stream, for visible cells). Values
+# of the groups that are not listed are not limited.
+DEFAULT_TOLERANCES = {
+    'bt_scan': 60000,
+    'calendar': 10 * 60000,
+    'multimedia': 5 * 60000,
+    'environment_sensors': 30 * 60000,
+    'motion_sensors': 20 * 60000,
+    'position_sensors': 20 * 60000,
+}
 
-        self.activity_rec = Example.get_nearest_example(time, activity_rec_data, None)
-        self.current_apps = self.get_nearest_example(time, running_apps, None)
-        self.bt_conn = Example.get_nearest_example(time, bt_conn, None)
-        self.bt_scan = Example.get_nearest_example(time, bt_scans, min_millis)
+# Window (millis) of the count of display "state on" events
+DISPLAY_ON_WINDOW = 5 * 60000
 
-        if self.bt_scan is None:
-            self.bt_scan = []
+# Features of a missing BT or Wi-Fi scan (the scans are parsed as padded feature rows, see reader.py)
+EMPTY_BT_SCAN = np.zeros(len(BT_SCAN_HEADER), dtype=np.int64)
+EMPTY_WIFI = np.zeros(len(WIFI_HEADER), dtype=np.float64)
 
-        self.current_calendar_events = Example.get_nearest_example(time, current_events, 10 * min_millis)
 
-        if self.current_calendar_events is None:
-            self.current_calendar_events = []
-
-        self.multimedia = self.get_nearest_example(time, multimedia_data, 5 * min_millis)
-        if self.multimedia is None:
-            self.multimedia = 0
+class Example:
 
-        self.visible_cells = Example.get_nearest_example(time, visible_cells, None)
-        self.display = Example.get_nearest_example(time, display_status, None)
-        self.display_on_count = Example.get_display_on_count(time, display_status, 5 * min_millis)
-        self.location = Example.get_nearest_example(time, location_data, None)
-        self.weather = Example.get_nearest_example(time, weather_info, None)
-        self.wifi_p2p = Example.get_nearest_example(time, wifi_p2p, None)
+    __slots__ = ['groups', 'missing', 'audio', 'battery', 'activity_rec', 'current_apps', 'bt_conn', 'bt_scan',
+                 'current_calendar_events', 'multimedia', 'visible_cells', 'display', 'display_on_count', 'location',
+                 'weather', 'wifi_p2p', 'wifi', 'environment_sensors', 'motion_sensors', 'position_sensors',
+                 'window', 'time_info', 'raw_time', 'label']
 
-        if self.wifi_p2p is None:
-            self.wifi_p2p = []
+    def __init__(self, time, label, audio_features, battery_features, activity_rec_data, bt_conn, bt_scans,
+                 current_events, visible_cells, display_status, location_data, weather_info, wifi_p2p, wifi,
+                 environment_data, motion_data, position_sensor_data, multimedia_data, running_apps, wifi_devices,
+                 bt_scan_devices, normalize,
+                 groups=DEFAULT_FEATURE_GROUPS, tz=DEFAULT_TZ, tolerances=DEFAULT_TOLERANCES, window=None):
+
+        # Only the attributes of the selected feature groups are set
+        self.groups = groups
+        self.missing = 0
+
+        if 'audio' in groups:
+            self.audio = self.require('audio', Example.get_nearest_example(time, audio_features,
+                                                                            tolerances.get('audio')))
+
+        if 'battery' in groups:
+            self.battery = self.require('battery', Example.get_nearest_example(time, battery_features,
+                                                                                tolerances.get('battery')))
+
+        if 'activity_rec' in groups:
+            self.activity_rec = self.require('activity_rec',
+                                             Example.get_nearest_example(time, activity_rec_data,
+                                                                         tolerances.get('activity_rec')))
+
+        if 'running_apps' in groups:
+            self.current_apps = self.require('running_apps',
+                                             Example.get_nearest_example(time, running_apps,
+                                                                         tolerances.get('running_apps')))
+
+        if 'bt_conn' in groups:
+            self.bt_conn = self.require('bt_conn', Example.get_nearest_example(time, bt_conn,
+                                                                                tolerances.get('bt_conn')))
+
+        if 'bt_scan' in groups:
+            self.bt_scan = Example.get_nearest_example(time, bt_scans, tolerances.get('bt_scan'))
+
+            if self.bt_scan is None:
+                self.bt_scan = EMPTY_BT_SCAN
+
+        if 'calendar' in groups:
+            self.current_calendar_events = Example.get_nearest_example(time, current_events,
+                                                                       tolerances.get('calendar'))
+
+            if self.current_calendar_events is None:
+                self.current_calendar_events = []
+
+        if 'multimedia' in groups:
+            self.multimedia = self.get_nearest_example(time, multimedia_data, tolerances.get('multimedia'))
+            if self.multimedia is None:
+                self.multimedia = 0
+
+        # Visible cells do not contribute any feature: they are only checked
+        if 'visible_cells' in groups:
+            self.visible_cells = self.require('visible_cells',
+                                              Example.get_nearest_example(time, visible_cells,
+                                                                          tolerances.get('visible_cells')))
+
+        if 'display' in groups:
+            self.display = self.require('display', Example.get_nearest_example(time, display_status,
+                                                                                tolerances.get('display')))
+            self.display_on_count = Example.get_display_on_count(time, display_status, DISPLAY_ON_WINDOW)
+
+        if 'location' in groups:
+            self.location = self.require('location', Example.get_nearest_example(time, location_data,
+                                                                                  tolerances.get('location')))
+
+        if 'weather' in groups:
+            self.weather = self.require('weather', Example.get_nearest_example(time, weather_info,
+                                                                                tolerances.get('weather')))
+
+        if 'wifi_p2p' in groups:
+            self.wifi_p2p = Example.get_nearest_example(time, wifi_p2p, tolerances.get('wifi_p2p'))
+
+            if self.wifi_p2p is None:
+                self.wifi_p2p = []
+
+        if 'wifi' in groups:
+            self.wifi = Example.get_nearest_example(time, wifi, tolerances.get('wifi'))
+
+            if self.wifi is None:
+                self.wifi = EMPTY_WIFI
+
+        if 'environment_sensors' in groups:
+            self.environment_sensors = self.require('environment_sensors',
+                                                    Example.get_nearest_example(time, environment_data,
+                                                                                tolerances.get('environment_sensors')))
+
+        if 'motion_sensors' in groups:
+            self.motion_sensors = self.require('motion_sensors',
+                                               Example.get_nearest_example(time, motion_data,
+                                                                           tolerances.get('motion_sensors')))
+
+        if 'position_sensors' in groups:
+            self.position_sensors = self.require('position_sensors',
+                                                 Example.get_nearest_example(time, position_sensor_data,
+                                                                             tolerances.get('position_sensors')))
+
+        # Window features (windows.window_features row at time): computed by the caller, in one pass over the
+        # increasing sample times
+        if 'window' in groups:
+            self.window = window
+
+        self.get_time_info(time, normalize, tz)
+        self.raw_time = time
+        self.label = label
 
-        self.wifi = Example.get_nearest_example(time, wifi, None)
+    def require(self, field, value):
 
-        if self.wifi is None:
-            self.wifi = []
+        if value is None:
+            self.missing |= REQUIRED_FIELDS[field]
 
-        #self.environment_sensors = Example.get_nearest_example(time, environment_data, 30 * min_millis)
-        #self.motion_sensors = Example.get_nearest_example(time, motion_data, 20 * min_millis)
-        #self.position_sensors = Example.get_nearest_example(time, position_sensor_data, 20 * min_millis)
-        self.get_time_info(time, normalize)
-        self.raw_time = time
-        self.label = label
+        return value
 
     @staticmethod
     def get_nearest_example(time, data, max_diff=None):
 
-        relevant_data = {k: v for k, v in data.items() if k <= time}
+        # Latest value at or before time (data is a TimeSeries, see reader.load_data)
+        return data.asof(time, max_diff)
 
-        example = None
+    @staticmethod
+    def get_display_on_count(time, data, max_diff=None):
 
-        if len(relevant_data) != 0:
+        # Number of "state on" display events in [time - max_diff, time]
+        return data.count_in_window(time, max_diff, is_display_on)
 
-            key = min(relevant_data.keys(), key=lambda k: abs(k - time))
+    def get_time_info(self, timestamp, normalize, tz=DEFAULT_TZ):
 
-            if max_diff is None or (max_diff is not None and abs(time-key) <= max_diff):
-                example = relevant_data.get(time, relevant_data[key])
+        self.time_info = get_time_info(timestamp, normalize, tz)
 
-        return example
+    def missing_fields(self):
+        return [field for field, bit in REQUIRED_FIELDS.items() if self.missing & bit]
 
-    @staticmethod
-    def get_display_on_count(time, data, max_diff=None):
-
-        relevant_data = {k: v for k, v in data.items() if k <= time and k >= (abs(max_diff - time))}
+    def is_valid(self, reasons=None):
+        """ An example is valid if no required value is missing. The missing fields of invalid examples are counted
+        in reasons (a Counter), if given.
+        """
 
-        count = 0
+        if self.missing == 0:
+            return True
 
-        for data in relevant_data.values():
-            if data[0] == 2:
-                count += 1
+        if reasons is not None:
+            reasons.update(self.missing_fields())
 
-        return count
+        return False
 
-    def week_of_month(self, dt):
-        """ Returns the week of the month for the specified date.
-        """
+    def get_features_vector(self):
 
-        first_day = dt.replace(day=1)
+        features = []
 
-        dom = dt.day
-        adjusted_dom = dom + first_day.weekday()
+        # ---- TIME (7 features) --------
+        if 'time' in self.groups:
+            features.extend(self.time_info)
 
-        return int(ceil(adjusted_dom / 7.0))
+        # ---- AUDIO (10 features) -------
+        if 'audio' in self.groups:
+            features.extend(self.audio)
 
-    def get_time_info(self, timestamp, normalize):
+        if 'display' in self.groups:
+            # ---- DISPLAY (2 features) -----
+            features.extend(self.display)
 
-        dt = datetime.fromtimestamp(timestamp / 1000.0)
+            # ---- DISPLAY COUNT -----
+            features.append(self.display_on_count)
 
-        dt.replace(microsecond=0)
+        # ---- BATTERY (2 features) -----
+        if 'battery' in self.groups:
+            features.extend(self.battery)
 
-        # Hour
-        start = datetime(dt.year, dt.month, dt.day, 0, 0, 0)
-        end = datetime(dt.year, dt.month, dt.day, 23, 59, 59)
+        # ---- ACTIVITY RECOGNITION (8 features) -----
+        if 'activity_rec' in self.groups:
+            features.extend(self.activity_rec)
 
-        norm_hour = (dt - start).seconds / (end - start).seconds
+        # ---- RUNNING APPS CATEGORIES (57 features) -----
+        if 'running_apps' in self.groups:
+            features.extend(self.current_apps)
 
-        if normalize:
-            # Day of the week (0 = Monday, 6 = Sunday)
-            norm_day_of_week = dt.weekday()/6
-        else:
-            norm_day_of_week = dt.weekday()
+        # ---- BLUETOOTH CONNECTIONS (6 features) -----
+        if 'bt_conn' in self.groups:
+            features.extend(bt_conn_features(self.bt_conn))
 
-        if normalize:
-            # Month of the year (1 = Gen, 12 = Dec)
-            norm_month = (dt.month-1)/11
-        else:
-            norm_month = (dt.month - 1)
+        # ---- BLUETOOTH SCANS (10 features) -----
+        if 'bt_scan' in self.groups:
+            features.extend(self.bt_scan.tolist())
 
-        if normalize:
-            # Week of the month
-            week = self.week_of_month(dt) / 4
-        else:
-            week = self.week_of_month(dt)
+        # ---- CALENDAR CURRENT EVENTS (1 features) -----
+        if 'calendar' in self.groups:
+            features.extend(calendar_features(self.current_calendar_events))
 
-        if normalize:
-            # Day of month
-            number_of_days = calendar.monthrange(dt.year, dt.month)[1]
-            norm_day_of_month = (dt.day - 1) / (number_of_days - 1)
-        else:
-            norm_day_of_month = dt.day - 1
+        # ---- MULTIMEDIA (1 features) -----
+        if 'multimedia' in self.groups:
+            features.append(self.multimedia)
 
-        # day_type  0 = working day     1 = weekend
-        day_type = 0
+        # ---- LOCATION (3 features) -----
+        if 'location' in self.groups:
+            features.extend(location_features(self.location))
 
-        # time       0 = morning         1 = afternoon       2 = evening         3 = night
-        hour_semantic = 0
+        # ---- WEATHER (9 features) -----
+        if 'weather' in self.groups:
+            features.extend(weather_features(self.weather))
 
-        if dt.weekday() >= 5:
-            day_type = 1
+        # ---- WIFI-P2P (5 features) ----
+        if 'wifi_p2p' in self.groups:
+            features.extend(wifi_p2p_features(self.wifi_p2p))
 
-        if 5 <= dt.hour <= 12:
-            hour_semantic = 0
-        elif 13 <= dt.hour <= 16:
-            hour_semantic = 1
-        elif 17 <= dt.hour <= 22:
-            hour_semantic = 2
-        elif 23 <= dt.hour <= 24 or 0 <= dt.hour <= 4:
-            hour_semantic = 3
+        # ---- WIFI (20 features) ----
+        if 'wifi' in self.groups:
+            features.extend(self.wifi.tolist())
 
-        if normalize:
-            hour_semantic = hour_semantic / 3
+        # ---- ENVIRONMENT SENSORS (8 features = light sensor) ----
+        if 'environment_sensors' in self.groups:
+            features.extend(self.environment_sensors)
 
-        #self.time_info = (norm_month, week, norm_day_of_month, norm_day_of_week, day_type, norm_hour, hour_semantic)
-        self.time_info = (day_type, norm_hour, hour_semantic)
+        # ---- MOTION SENSORS (120 features) ----
+        if 'motion_sensors' in self.groups:
+            features.extend(self.motion_sensors)
 
-    def is_valid(self):
-        fields = [a for a in dir(self) if not a.startswith('__') and not callable(getattr(self, a))]
+        # ---- POSITION SENSORS (8 features = proximity sensor) ----
+        if 'position_sensors' in self.groups:
+            features.extend(self.position_sensors)
 
-        for field in fields:
-            if getattr(self, field) is None:
-                print(field + " is None!")
-                return False
+        # ---- SLIDING WINDOWS (4 features) ----
+        if 'window' in self.groups:
+            features.extend(self.window)
 
-        return True
+        return features
 
-    def get_features_vector(self):
 
-        features = []
+'''
+Feature encoders: map a single stream value to the list of features it contributes to the dataset. They are shared by
+Example.get_features_vector and by the batch engine in features.py.
+'''
 
-        # ---- TIME (7 features) --------
-        features.extend(self.time_info)
 
-        # ---- AUDIO (10 features) -------
-        features.extend(self.audio)
+def is_display_on(display):
+    # display[0] = display state (0: unknown, 1: sate_off, 2: state_on, 3: state_doze, 4: state_doze_suspend)
+    return display[0] == 2
 
-        # ---- DISPLAY (2 features) -----
-        features.extend(self.display)
 
-        # ---- DISPLAY COUNT -----
-        features.append(self.display_on_count)
+def bt_conn_features(devices):
 
-        # ---- BATTERY (2 features) -----
-        features.extend(self.battery)
+    bt = []
+    for dev in devices:
+        bt.append(dev[0])
+        bt.append(dev[1])
 
-        # ---- ACTIVITY RECOGNITION (8 features) -----
-        features.extend(self.activity_rec)
+    return (bt + [0] * 3 * 2)[:3 * 2]
 
-        # ---- RUNNING APPS CATEGORIES (57 features) -----
-        features.extend(self.current_apps)
 
-        # ---- BLUETOOTH CONNECTIONS (6 features) -----
-        bt = []
-        for dev in self.bt_conn:
-            bt.append(dev[0])
-            bt.append(dev[1])
+def calendar_features(events):
 
-        bt = (bt + [0] * 3 * 2)[:3 * 2]
-        features.extend(bt)
+    if len(events) > 0:
+        return [1]
 
-        # ---- BLUETOOTH SCANS (10 features) -----
-        bt = []
-        self.bt_scan.sort(key=lambda tup: tup[2], reverse=False)
-        for dev in self.bt_scan[0:5]:
-            bt.append(dev[0])
-            bt.append(dev[1])
+    return [0]
 
-        bt = (bt + [0] * 5 * 2)[:5 * 2]
-        features.extend(bt)
 
-        # ---- CALENDAR CURRENT EVENTS (1 features) -----
-        if len(self.current_calendar_events) > 0:
-            features.append(1)
-        else:
-            features.append(0)
+def location_features(location):
+    return [location[0], location[1], location[4]]
 
-        # ---- MULTIMEDIA (1 features) -----
-        features.append(self.multimedia)
 
-        # ---- LOCATION (3 features) -----
-        features.extend([self.location[0], self.location[1], self.location[4]])
+def weather_features(weather):
+    return list(weather[:9])
 
-        # ---- WEATHER (9 features) -----
-        features.extend(self.weather[:9])
 
-        # ---- WIFI-P2P (5 features) ----
-        wifi_p2p = []
-        wifi_p2p.extend(self.wifi_p2p)
-        wifi_p2p = (wifi_p2p + [0] * 5)[:5]
-        features.extend(wifi_p2p)
+def wifi_p2p_features(devices):
 
-        # ---- WIFI (20 features) ----
-        wifi = []
-        self.wifi.sort(key=lambda tup: tup[1], reverse=True)
-        for ap in self.wifi[0:5]:
-            wifi.append(ap[0])
-            wifi.append(ap[1])
-            wifi.append(ap[3])
-            wifi.append(ap[4])
+    wifi_p2p = []
+    wifi_p2p.extend(devices)
 
-        wifi = (wifi + [0] * 5*4)[:5*4]
-        features.extend(wifi)
+    return (wifi_p2p + [0] * 5)[:5]
 
-        # ---- ENVIRONMENT SENSORS (8 features = light sensor) ----
-        #features.extend(self.environment_sensors)
 
-        # ---- MOTION SENSORS (120 features) ----
-        #features.extend(self.motion_sensors)
+def get_time_info(timestamp, normalize, tz=DEFAULT_TZ):
 
-        # ---- POSITION SENSORS (8 features = proximity sensor) ----
-        #features.extend(self.position_sensors)
+    features = get_time_features([timestamp], normalize, tz)
 
-        return features
+    return tuple(features[column][0].item() for column in TIME_HEADER)
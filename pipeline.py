@@ -0,0 +1,169 @@
+import numpy as np
+
+import reader
+from features import DEFAULT_STEP, DEFAULT_TRIM, get_sample_times, build_feature_matrix
+from model import DEFAULT_TOLERANCES
+from play_store import GooglePlayStore
+from scaler import Scaler
+from sensor_normalizer import SensorRanges
+from time_features import DEFAULT_TZ
+from instrumentation import REPORT
+from utils import DEFAULT_FEATURE_GROUPS, get_dataset_header
+
+'''
+Library API: the examples of a user directory, computed lazily in-process, without writing any dataset file:
+
+    for time, label, features in iter_examples(user_dir, {'google': google_dir}):
+        ...
+
+    for times, labels, matrix in iter_examples(user_dir, {'google': google_dir, 'batch_size': 512}):
+        ...
+
+The feature rows are the rows of the dataset built by datasetcreator.py with the same settings (batch engine, see
+features.py), in the order of the activities and of their sample times. The streams are parsed once, then the sample
+times are processed in chunks: only the feature rows of the current chunk and batch are held in memory.
+
+With normalize, the rows are scaled with the default scaler, or with config['scaler'] (the scaler.json of a dataset).
+The ranges of the sensors features are fitted on a whole dataset: with the sensors groups, a saved scaler is required.
+'''
+
+# Settings of iter_examples: google (GooglePlayStore, or its directory) is required
+DEFAULT_CONFIG = {
+    'google': None,
+    'normalize': False,
+    'scaler': None,
+    'groups': DEFAULT_FEATURE_GROUPS,
+    'step': DEFAULT_STEP,
+    'trim': DEFAULT_TRIM,
+    'tz': DEFAULT_TZ,
+    'tolerances': {},
+    'jobs': 1,
+    'cache': False,
+    'activities': None,
+    'batch_size': None,
+}
+
+# Sample times computed at once when the examples are not batched
+CHUNK_SIZE = 1024
+
+
+def get_config(config=None):
+    """ Returns the settings of config (a dict of DEFAULT_CONFIG keys) completed with the defaults. The tolerances
+    override DEFAULT_TOLERANCES, group by group (None: no limit).
+    """
+
+    config = dict(config or {})
+
+    unknown = [key for key in config if key not in DEFAULT_CONFIG]
+    if len(unknown) > 0:
+        raise ValueError("unknown settings: " + ', '.join(unknown) + " (available: " + ', '.join(DEFAULT_CONFIG) + ")")
+
+    settings = dict(DEFAULT_CONFIG)
+    settings.update(config)
+
+    if settings['google'] is None:
+        raise ValueError("the google setting (GooglePlayStore or its directory) is required")
+
+    if isinstance(settings['google'], str):
+        settings['google'] = GooglePlayStore(settings['google'])
+
+    if settings['batch_size'] is not None and settings['batch_size'] <= 0:
+        raise ValueError("the batch size must be positive")
+
+    tolerances = dict(DEFAULT_TOLERANCES)
+    tolerances.update(settings['tolerances'])
+    settings['tolerances'] = tolerances
+
+    return settings
+
+
+def get_scaler(settings, header):
+
+    if not settings['normalize']:
+        return None
+
+    if settings['scaler'] is not None:
+        return Scaler.load(settings['scaler'], header)
+
+    if len(SensorRanges(header)) > 0:
+        raise ValueError("normalizing the sensors features requires a saved scaler (the scaler setting)")
+
+    return Scaler.default(header)
+
+
+def iter_examples(user_dir, config=None, reasons=None):
+    """ Yields the valid examples of the user activities (all of them, or config['activities']): (time, label,
+    features) tuples, features being a float array, or with config['batch_size'] (times, labels, matrix) batches of
+    batch_size rows (the last one can be smaller). Missing values are counted in reasons (a Counter), if given.
+    """
+
+    settings = get_config(config)
+
+    batch_size = settings['batch_size']
+
+    scaler = get_scaler(settings, get_dataset_header(settings['google'], settings['groups']))
+
+    batches = iter_batches(user_dir, settings, scaler, CHUNK_SIZE if batch_size is None else batch_size, reasons)
+
+    if batch_size is not None:
+        return batches
+
+    return (example for times, labels, matrix in batches for example in zip(times.tolist(), labels.tolist(), matrix))
+
+
+def get_header(config=None):
+    """ Returns the dataset header (names of the features) of the rows of iter_examples.
+    """
+
+    settings = get_config(config)
+
+    return get_dataset_header(settings['google'], settings['groups'])
+
+
+def iter_batches(user_dir, settings, scaler, batch_size, reasons=None):
+
+    activities = settings['activities']
+    if activities is None:
+        activities = reader.read_activities(user_dir)
+
+    if len(activities) == 0:
+        return
+
+    groups = settings['groups']
+
+    with REPORT.stage('load_data'):
+        streams = reader.load_data(user_dir, settings['google'], jobs=settings['jobs'], cache=settings['cache'],
+                                   groups=groups)
+
+    # Rows computed and not yielded yet
+    pending = None
+
+    for activity in activities:
+        sample_times = get_sample_times(activity, min_millis=settings['step'], span=settings['trim'])
+
+        for start in range(0, len(sample_times), batch_size):
+            with REPORT.stage('examples'):
+                times, matrix = build_feature_matrix(sample_times[start:start + batch_size], streams,
+                                                     settings['normalize'], groups, reasons, settings['tz'],
+                                                     settings['tolerances'])
+
+            if len(times) == 0:
+                continue
+
+            if scaler is not None:
+                matrix = scaler.transform(matrix)
+
+            labels = np.full(len(times), activity[2], dtype=object)
+
+            if pending is None:
+                pending = (times, labels, matrix)
+            else:
+                pending = tuple(np.concatenate([old, new]) for old, new in zip(pending, (times, labels, matrix)))
+
+            while len(pending[0]) >= batch_size:
+                yield tuple(values[:batch_size] for values in pending)
+
+                pending = tuple(values[batch_size:] for values in pending)
+
+    if pending is not None and len(pending[0]) > 0:
+        yield pending
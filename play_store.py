@@ -1,103 +1,274 @@
 from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
 import requests
+import threading
+import time
 import os
 
+from category_store import CategoryStore, tsv_fingerprint
+from instrumentation import REPORT
+
 
 class GooglePlayStore:
 
     PLAYSTORE_URL = 'https://play.google.com/store/apps/details?hl=en&id='
     packages = {}
     cache_file = None
+    store_file = None
     app_categories_file = None
     cache_sep = "\t"
     store_categories = []
     new_files = False
 
     def __init__(self, out_dir, cache_file='./known_apps.dat', app_categories_file='./play_store_app_categories.dat',
-                 new_files=False):
-
+                 new_files=False, store_url=PLAYSTORE_URL, store_file='./known_apps.db'):
+
+        # Per-instance state, so that the instance can be pickled (e.g. to load data on a process pool)
+        self.packages = {}
+        self.store_categories = []
+        self.store_url = store_url
+        self.session = None
+        self.session_pool_size = 0
+        self.store = None
+        self.store_writable = False
+
+        # cache_file is the old flat known apps file: it is only read, to fill the store (see get_store)
         self.cache_file = out_dir + "/" + cache_file
+        self.store_file = out_dir + "/" + store_file
         self.app_categories_file = out_dir + "/" + app_categories_file
         self.new_files = new_files
 
+        self.load_known_apps()
+
         if not new_files:
 
-            self.load_known_apps()
             self.read_apps_cateogires()
 
         else:
 
-            if os.path.exists(cache_file):
-                os.remove(cache_file)
-            file = open(cache_file, 'w')
+            # The categories are fetched again; the store is kept, its entries are fetched again once stale
+            file = open(self.app_categories_file, 'w')
             file.close()
 
-            if os.path.exists(app_categories_file):
-                os.remove(app_categories_file)
-            file = open(cache_file, 'w')
-            file.close()
+    def get_store(self, writable=False):
+        """ Returns the store of known apps. The store file is only written by the fetcher (new_files, or writable
+        for the packages fetched): it is created if needed, and the known apps file is imported again whenever it
+        changes. Otherwise (e.g. to build a dataset), the store file is opened read-only, or, if there is none, the
+        known apps file is imported in an in-memory store: the input directory is never written.
+        """
 
-    def get_package_category(self, package):
+        if self.store is not None and (self.store_writable or not writable):
+            return self.store
+
+        if self.store is not None:
+            self.store.close()
 
-        genres = None
+        self.store_writable = writable or self.new_files
+
+        if self.store_writable:
+            self.store = CategoryStore(self.store_file)
+        elif os.path.exists(self.store_file):
+            self.store = CategoryStore(self.store_file, readonly=True)
+            return self.store
+        else:
+            self.store = CategoryStore(':memory:')
+
+        if os.path.exists(self.cache_file) and self.store.imported_tsv() != tsv_fingerprint(self.cache_file):
+            print("Imported " + str(self.store.import_tsv(self.cache_file, self.cache_sep)) + " known apps from " +
+                  self.cache_file)
+
+        return self.store
+
+    def get_package_category(self, package):
+        """ Returns the (first) genre of the package, or None if it is not known. With new_files, packages that are
+        not in the store (or whose entry is stale) are fetched from the Play Store: failed requests are not stored.
+        """
 
         if package in self.packages:
-            genres = self.packages[package]
+            REPORT.count('play_store_memo_hits')
+            return self.packages[package]
+
+        store = self.get_store()
+
+        if self.new_files and not store.is_fresh(package):
+            REPORT.count('play_store_fetches')
+
+            with REPORT.stage('play_store_fetch'):
+                page = self.fetch_page(self.get_session(), package)
+
+                if page is not None:
+                    self.add_packages({package: self.page_genres(page)})
+                else:
+                    REPORT.count('play_store_fetch_failures')
+                    self.packages[package] = None
+
+        else:
+
+            with REPORT.stage('play_store_lookup'):
+                genres = store.get_genres(package)
+
+            REPORT.count('play_store_store_misses' if genres is None else 'play_store_store_hits')
+            self.packages[package] = None if genres is None else genres[0]
+
+        return self.packages[package]
+
+    def fetch_categories(self, packages, workers=8, rate=10.0, retries=3, backoff=1.0, timeout=10.0, progress=False):
+        """ Fetches the categories of the packages that are not known yet, with at most workers concurrent requests
+        over a pool of keep-alive connections, and at most rate requests per second (None: no limit). Failed requests
+        (connection errors, timeouts, 429 and 5xx responses) are retried up to retries times, with exponential backoff;
+        packages whose requests still fail are not stored, so they are fetched again by the next run. Packages with a
+        fresh entry in the store (including negative ones) are not fetched again.
+        Returns a dict with the list of genres of every package found (including the already known ones).
+        """
+
+        store = self.get_store()
+
+        result = {}
+        missing = []
+
+        with REPORT.stage('play_store_lookup'):
+            for package in sorted(set(packages)):
+                if store.is_fresh(package):
+                    genres = store.get_genres(package)
+                    if genres is not None:
+                        result[package] = genres
+                else:
+                    missing.append(package)
+
+        REPORT.count('play_store_store_hits', len(set(packages)) - len(missing))
+        REPORT.count('play_store_fetches', len(missing))
+
+        if len(missing) == 0:
+            return result
+
+        session = self.get_session(workers)
+        limiter = RateLimiter(rate)
+
+        def fetch(package):
+            page = self.fetch_page(session, package, retries, backoff, timeout, limiter)
+            return package, None if page is None else self.page_genres(page)
+
+        found = {}
 
-        elif self.new_files:
+        with REPORT.stage('play_store_fetch'), ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch, package) for package in missing]
 
-            genres = set()
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading apps categories",
+                               disable=not progress):
+                package, genres = future.result()
 
-            page = requests.get(GooglePlayStore.PLAYSTORE_URL + package)
+                if genres is not None:
+                    found[package] = genres
+                else:
+                    REPORT.count('play_store_fetch_failures')
 
-            if page.status_code == 200:
-                soup = BeautifulSoup(page.content, 'html.parser')
+        # Packages without genres are stored too, as negative results
+        self.add_packages(found)
+        result.update({package: genres for package, genres in found.items() if len(genres) > 0})
 
-                for link in soup.find_all('a', itemprop="genre"):
-                    if "href" in link.attrs and "apps/category/" in link["href"]:
-                        cat = link["href"].split("/")[-1]
-                        if cat in self.store_categories:
-                            genres.add(cat)
+        return result
 
-                if len(genres) > 0:
+    def get_session(self, pool_size=1):
 
-                    log_list = [package]
-                    log_list.extend(genres)
+        if self.session is None or self.session_pool_size < pool_size:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+            self.session_pool_size = pool_size
 
-                    self.packages[package] = genres
+        return self.session
 
-                    with open(self.cache_file, "a") as myfile:
-                        myfile.write(self.cache_sep.join(log_list) + "\n")
+    def fetch_page(self, session, package, retries=0, backoff=1.0, timeout=None, limiter=None):
+        """ Returns the store page of the package: a 200 response, or a 404 one for packages that are not in the store.
+        Returns None if the request failed (connection errors, timeouts, other statuses, 429 and 5xx responses after
+        the retries).
+        """
 
+        for attempt in range(retries + 1):
 
-                #details = soup.find('body').find("div", {"class": "details-info"})
+            if attempt > 0:
+                time.sleep(backoff * 2 ** (attempt - 1))
 
-                    #if details is not None:
-                    #genre = details.find("a", {"class": "category"})["href"].split("/")[-1]
+            if limiter is not None:
+                limiter.wait()
 
-                        #if genre is not None:
-                        #with open(self.cache_file, "a") as myfile:
-                        #    myfile.write(package + self.cache_sep + genre + "\n")
-                #self.packages[package] = genre
+            try:
+                page = session.get(self.store_url + package, timeout=timeout)
+            except requests.RequestException:
+                continue
+
+            if page.status_code == 429 or page.status_code >= 500:
+                continue
+
+            if page.status_code == 200 or page.status_code == 404:
+                return page
+
+            return None
+
+        return None
+
+    def page_genres(self, page):
+        """ Returns the sorted list of genres of a page of fetch_page (empty for a package that is not in the store).
+        """
+
+        if page.status_code == 404:
+            return []
+
+        return sorted(self.parse_genres(page.content))
+
+    def parse_genres(self, content):
+
+        genres = set()
+
+        soup = BeautifulSoup(content, 'html.parser')
+
+        for link in soup.find_all('a', itemprop="genre"):
+            if "href" in link.attrs and "apps/category/" in link["href"]:
+                cat = link["href"].split("/")[-1]
+                if cat in self.store_categories:
+                    genres.add(cat)
 
         return genres
 
+    def add_packages(self, packages):
+        """ Records the genres of the packages (empty for packages without a known genre) in the store, with one
+        batched write.
+        """
+
+        if len(packages) == 0:
+            return
+
+        packages = {package: sorted(genres) for package, genres in packages.items()}
+
+        self.get_store(writable=True).put_many(packages)
+
+        for package, genres in packages.items():
+            self.packages[package] = genres[0] if len(genres) > 0 else None
+
     def load_known_apps(self):
+        """ Opens the store of known apps (entries are read on demand), see get_store.
+        """
 
         print("Reading known apps...")
 
-        with open(self.cache_file) as f:
-            content = f.readlines()
-        content = [x.strip() for x in content]
+        store = self.get_store()
+
+        if not self.store_writable and os.path.exists(self.store_file) and os.path.exists(self.cache_file) and \
+                store.imported_tsv() != tsv_fingerprint(self.cache_file):
+            print("Warning: " + self.cache_file + " changed since it was imported in " + self.store_file + ", which "
+                  "is used instead (run apps_data_generator.py to import it again)")
+
+    def fingerprint(self):
+        """ Changes whenever the categories or the content of the store change.
+        """
 
-        for element in content:
-            app = element.split(self.cache_sep)[0]
-            genre = element.split(self.cache_sep)[1]
-            self.packages[app] = genre
+        return self.store_categories + self.get_store().fingerprint()
 
     def fetch_apps_categories(self):
         print("Fetching Google Play Store Apps categories...")
-        page = requests.get(GooglePlayStore.PLAYSTORE_URL + "com.facebook.katana")
+        page = self.get_session().get(self.store_url + "com.facebook.katana")
 
         if page.status_code == 200:
             soup = BeautifulSoup(page.content, 'html.parser')
@@ -137,3 +308,38 @@ class GooglePlayStore:
             cat_id = cat_id + 1
 
         return cats
+
+    def __getstate__(self):
+
+        # HTTP sessions and store connections are not shared with other processes
+        state = self.__dict__.copy()
+        state['session'] = None
+        state['session_pool_size'] = 0
+        state['store'] = None
+        state['store_writable'] = False
+
+        return state
+
+
+class RateLimiter:
+    """ Spaces the calls to wait() (from any thread) by at least 1/rate seconds.
+    """
+
+    def __init__(self, rate=None):
+
+        self.interval = 0 if rate is None else 1.0 / rate
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+
+        if self.interval == 0:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+
+        if start > now:
+            time.sleep(start - now)
@@ -0,0 +1,152 @@
+import gzip
+import io
+import lzma
+import os.path
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+'''
+Access to the raw data files, plain or compressed: every file (e.g. user/audio.csv) can also be stored as
+audio.csv.gz, audio.csv.xz or audio.csv.zst (the zstandard package is needed for the latter), and it is decompressed
+while it is read, without any temporary copy. The plain file is used if it exists.
+
+With threaded, the decompression runs in a background thread, a few blocks ahead of the reader, so that it overlaps
+with the parsing (zlib, lzma and zstandard release the GIL while they decompress).
+'''
+
+COMPRESSED_EXTENSIONS = ['.gz', '.xz', '.zst']
+
+# Decompressed bytes read at once by the background thread, and blocks it can read ahead of the reader
+THREAD_BLOCK_BYTES = 1024 * 1024
+THREAD_BLOCKS = 8
+
+
+def find_raw_file(file_name):
+    """ Returns the path of the raw file: file_name itself if it exists or if there is no compressed copy of it (the
+    caller then gets the usual missing file errors), the first existing compressed copy otherwise.
+    """
+
+    if os.path.isfile(file_name):
+        return file_name
+
+    for extension in COMPRESSED_EXTENSIONS:
+        if os.path.isfile(file_name + extension):
+            return file_name + extension
+
+    return file_name
+
+
+def open_raw(file_name, mode='r', threaded=False):
+    """ Opens the raw file (see find_raw_file) for reading, in text ('r') or binary ('rb') mode, decompressing it if
+    it is compressed. With threaded, compressed files are decompressed in a background thread.
+    """
+
+    path = find_raw_file(file_name)
+    extension = os.path.splitext(path)[1]
+
+    if extension not in COMPRESSED_EXTENSIONS:
+        return open(path, mode)
+
+    if extension == '.gz':
+        f = gzip.open(path, 'rb')
+    elif extension == '.xz':
+        f = lzma.open(path, 'rb')
+    else:
+        if zstandard is None:
+            raise RuntimeError("reading " + path + " requires the zstandard package (pip install zstandard)")
+        f = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+    if threaded:
+        f = io.BufferedReader(ThreadedReader(f), THREAD_BLOCK_BYTES)
+
+    if 'b' in mode:
+        return f
+
+    return io.TextIOWrapper(f)
+
+
+class ThreadedReader(io.RawIOBase):
+    """ Reads a binary file in a background thread, up to THREAD_BLOCKS blocks ahead.
+    """
+
+    def __init__(self, f, block_bytes=THREAD_BLOCK_BYTES, blocks=THREAD_BLOCKS):
+
+        io.RawIOBase.__init__(self)
+
+        self.f = f
+        self.block_bytes = block_bytes
+
+        # Blocks read, then None at the end of the file (or the exception raised by the reads)
+        self.blocks = queue.Queue(maxsize=blocks)
+        self.block = b''
+        self.position = 0
+        self.done = False
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read_blocks, daemon=True)
+        self.thread.start()
+
+    def read_blocks(self):
+
+        try:
+            for block in iter(lambda: self.f.read(self.block_bytes), b''):
+                if not self.put(block):
+                    return
+            self.put(None)
+        except Exception as e:
+            self.put(e)
+
+    def put(self, item):
+        """ Queues item, unless the reader is closed first. Returns whether item was queued.
+        """
+
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+
+        while self.position == len(self.block):
+            if self.done:
+                return 0
+
+            block = self.blocks.get()
+
+            if isinstance(block, Exception):
+                self.done = True
+                raise block
+
+            if block is None:
+                self.done = True
+                return 0
+
+            self.block = block
+            self.position = 0
+
+        size = min(len(buffer), len(self.block) - self.position)
+        buffer[:size] = self.block[self.position:self.position + size]
+        self.position = self.position + size
+
+        return size
+
+    def close(self):
+
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.f.close()
+
+        io.RawIOBase.close(self)
@@ -1,9 +1,19 @@
 import csv
+import hashlib
+import heapq
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 import os.path
+import time
 
-from utils import normalize_mac, mac_to_int
+import numpy as np
+
+from utils import MAC_TABLE, BT_SCAN_HEADER, WIFI_HEADER, get_feature_groups_streams
+from timeseries import TimeSeries
+import stream_cache
+from raw_files import find_raw_file, open_raw
+from instrumentation import REPORT
 
 '''
 Files:
@@ -30,6 +40,8 @@ Files:
     - wifi_p2p_scans.csv                list of Wi-Fi P2P devices in proximity
     - wifi_scans.csv                    list of Wi-FI AP in proximity
     - multimedia.csv                    picture/videos
+
+Every file can also be compressed (.csv.gz, .csv.xz or .csv.zst): it is decompressed while it is parsed (raw_files.py).
 '''
 
 
@@ -44,7 +56,7 @@ def read_activities(main_dir):
 
     activities = []
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
@@ -63,17 +75,13 @@ def get_activity_recognition_data(main_dir):
 
     data = {}
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
             time = int(row[0])
-            if normalize:
-                data[time] = (int(row[1])/100, int(row[2])/100, int(row[3])/100, int(row[4])/100, int(row[5])/100,
-                              int(row[6])/100, int(row[7])/100, int(row[8])/100)
-            else:
-                data[time] = (int(row[1]), int(row[2]), int(row[3]), int(row[4]), int(row[5]), int(row[6]), int(row[7]),
-                              int(row[8]))
+            data[time] = (int(row[1]), int(row[2]), int(row[3]), int(row[4]), int(row[5]), int(row[6]), int(row[7]),
+                          int(row[8]))
 
     return data
 
@@ -88,7 +96,7 @@ def get_installed_apps_frequency(google, main_dir):
 
     frequencies = {}
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
@@ -117,29 +125,47 @@ RUNNING APPS
 
 
 def get_running_apps_frequency(google, main_dir):
+    """ Returns a TimeSeries of category vectors: one column per Play Store category, holding 1 if an app of that
+    category is running and the category id otherwise. Every package is looked up only once (interned to the column of
+    its category), and the vectors are rows of a single small-integer matrix.
+    """
+
     file_name = main_dir + '/running_apps.csv'
 
     print("Reading running apps from " + file_name)
 
-    with open(file_name) as csvfile:
-        rows = csv.reader(csvfile, delimiter='\t')
+    categories = google.get_categories()
 
-        data = {}
+    # Package name -> column of its category (-1 if the category is not known)
+    columns = {}
+
+    times = []
+    running_rows = []
+    running_columns = []
+
+    with open_raw(file_name) as csvfile:
+        rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
-            time = int(row[0])
+            times.append(int(row[0]))
 
-            categories = google.get_categories()
+            for element in row[1:]:
+                column = columns.get(element)
 
-            for element in row:
-                if element != row[0]:
-                    category = google.get_package_category(element)
-                    if category is not None:
-                        categories[category] = 1
+                if column is None:
+                    column = categories.get(google.get_package_category(element), 0) - 1
+                    columns[element] = column
 
-            data[time] = list(categories.values())
+                if column >= 0:
+                    running_rows.append(len(times) - 1)
+                    running_columns.append(column)
 
-    return data
+    base = np.arange(1, len(categories) + 1, dtype=np.min_scalar_type(len(categories)))
+
+    data = np.tile(base, (len(times), 1))
+    data[running_rows, running_columns] = 1
+
+    return TimeSeries.from_arrays(times, data)
 
 
 def get_running_apps(google, main_dir):
@@ -147,9 +173,7 @@ def get_running_apps(google, main_dir):
 
     print("Reading running apps from " + file_name)
 
-    global normalize
-
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         data = {}
@@ -167,8 +191,6 @@ def get_running_apps(google, main_dir):
                     if category is not None:
                         cat = categories[category]
 
-            if normalize:
-                cat = cat / 59
             data[time] = cat
 
     return data
@@ -184,41 +206,14 @@ def get_weather_info(main_dir):
 
     data = {}
 
-    global normalize
-
-    # temp = [-50, 50]
-    temp_c_max = 50
-    temp_c_range = 100
-
-    #wind speed = [0, 100] m/s
-    max_wind_speed = 100
-
-    # wind direction http://snowfence.umn.edu/Components/winddirectionanddegreeswithouttable3.htm
-    max_wind_direction = 348.75
-
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
             time = int(row[0])
 
-            if normalize:
-                #http://www.openweathermap.com/current
-                weather_code = int(row[1])/962
-                temp = (float(row[2]) + temp_c_max)/temp_c_range
-                temp_min = (float(row[3]) + temp_c_max) / temp_c_range
-                temp_max = (float(row[4]) + temp_c_max) / temp_c_range
-                humidity = float(row[5]) / 100.0
-                pressure = float(row[6])
-                wind_speed = float(row[7]) / max_wind_speed
-                wind_direction = float(row[8]) / max_wind_direction
-                cloudiness = float(row[9]) / 100.0
-
-                data[time] = (weather_code, temp, temp_min, temp_max, humidity, pressure, wind_speed, wind_direction,
-                              cloudiness, float(row[10]), float(row[11]))
-            else:
-                data[time] = (int(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]), float(row[6]),
-                              float(row[7]), float(row[8]), float(row[9]), float(row[10]), float(row[11]))
+            data[time] = (int(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]), float(row[6]),
+                          float(row[7]), float(row[8]), float(row[9]), float(row[10]), float(row[11]))
     return data
 
 
@@ -237,7 +232,7 @@ def read_installed_apps(main_dir, sub_dirs, google):
 
         print("Reading apps in "+file_name)
 
-        with open(file_name) as csvfile:
+        with open_raw(file_name) as csvfile:
             rows = csv.reader(csvfile, delimiter='\t')
 
             for row in rows:
@@ -267,7 +262,7 @@ def read_all_apps(main_dir, sub_dirs):
         installed_apps_file = main_dir + "/" + dir + '/installed_apps.csv'
         running_apps_file = main_dir + "/" + dir + '/running_apps.csv'
 
-        with open(installed_apps_file) as csvfile:
+        with open_raw(installed_apps_file) as csvfile:
             rows = csv.reader(csvfile, delimiter='\t')
 
             for row in rows:
@@ -277,7 +272,7 @@ def read_all_apps(main_dir, sub_dirs):
                 except ValueError:
                     continue
 
-        with open(running_apps_file) as csvfile:
+        with open_raw(running_apps_file) as csvfile:
             rows = csv.reader(csvfile, delimiter='\t')
 
             for row in rows:
@@ -306,21 +301,15 @@ def get_audio_features(main_dir):
 
     data = {}
 
-    global normalize
-
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
             time = int(row[0])
 
             # row[1] = ringer_mode (0: silent, 1: vibrate, 2: normal)
-            if normalize:
-                data[time] = (int(row[1])/2, float(row[2]), float(row[3]), float(row[4]), float(row[5]),
-                              bool_val(row[6]), bool_val(row[7]), bool_val(row[8]), bool_val(row[9]), bool_val(row[10]))
-            else:
-                data[time] = (int(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]), bool_val(row[6]),
-                              bool_val(row[7]), bool_val(row[8]), bool_val(row[9]), bool_val(row[10]))
+            data[time] = (int(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]), bool_val(row[6]),
+                          bool_val(row[7]), bool_val(row[8]), bool_val(row[9]), bool_val(row[10]))
 
     return data
 
@@ -335,9 +324,7 @@ def get_battery_features(main_dir):
 
     data = {}
 
-    global normalize
-
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
@@ -346,9 +333,6 @@ def get_battery_features(main_dir):
             level = float(row[1])
             connected = int(row[2])
 
-            if normalize:
-                connected = connected / 4
-
             data[time] = (level, connected)
 
     return data
@@ -364,7 +348,7 @@ def get_bt_conn(main_dir):
 
     data = {}
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
@@ -373,12 +357,8 @@ def get_bt_conn(main_dir):
             if len(row) > 1 and len(row[1]) > 0:
                 for element in row:
                     if element != row[0]:
-                        if normalize:
-                            # Max BT Major device class is "Uncategorized" = 7936
-                            # https://developer.android.com/reference/android/bluetooth/BluetoothClass.Device.Major.html
-                            devices.append((normalize_mac(element.split(",")[1]), int(element.split(",")[2])/7936))
-                        else:
-                            devices.append((mac_to_int(element.split(",")[1]), int(element.split(",")[2])))
+                        fields = element.split(",")
+                        devices.append((MAC_TABLE.to_int(fields[1]), int(fields[2])))
 
             data[time] = devices
 
@@ -390,32 +370,61 @@ BLUETOOTH SCANS
 ====================================================================================================================='''
 
 
+# Devices of every scan kept as features: (MAC address, major class) of the strongest ones
+TOP_BT_DEVICES = len(BT_SCAN_HEADER) // 2
+
+
 def get_bt_scans(main_dir):
+    """ Returns the scans as a TimeSeries of int64 rows (BT_SCAN_HEADER): address and major class of the
+    TOP_BT_DEVICES devices with the highest RSSI, padded with zeros.
+    """
+
     file_name = main_dir + '/bt_scan.csv'
 
-    data = {}
+    times = []
+    scans = []
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
-            time = int(row[0])
+            times.append(int(row[0]))
 
             devices = []
             if len(row) > 1 and len(row[1]) > 0:
-                for element in row:
-                    # Append MAC ADDRESS, Device BT Major ID, and RSSI
-                    if element != row[0]:
-                        if normalize:
-                            # Max BT Major device class is "Uncategorized" = 7936
-                            # https://developer.android.com/reference/android/bluetooth/BluetoothClass.Device.Major.html
-                            devices.append((normalize_mac(element.split(",")[1]), int(element.split(",")[2])/7936,
-                                            element.split(",")[3]))
-                        else:
-                            devices.append((mac_to_int(element.split(",")[1]), int(element.split(",")[2]),
-                                            element.split(",")[3]))
+                for element in row[1:]:
+                    # MAC ADDRESS, Device BT Major ID, and RSSI
+                    fields = element.split(",")
+                    devices.append((MAC_TABLE.to_int(fields[1]), int(fields[2]), float(fields[3])))
 
-            data[time] = devices
+            scan = [0] * len(BT_SCAN_HEADER)
+
+            for i, device in enumerate(heapq.nlargest(TOP_BT_DEVICES, devices, key=lambda device: device[2])):
+                scan[2 * i] = device[0]
+                scan[2 * i + 1] = device[1]
+
+            scans.append(scan)
+
+    return TimeSeries.from_arrays(times, np.array(scans, dtype=np.int64).reshape(len(times), len(BT_SCAN_HEADER)))
+
+
+def get_bt_scan_devices(main_dir):
+    """ Returns the MAC addresses of all the devices of every scan (see windows.py).
+    """
+
+    file_name = main_dir + '/bt_scan.csv'
+
+    data = {}
+
+    with open_raw(file_name) as csvfile:
+        rows = csv.reader(csvfile, delimiter='\t')
+
+        for row in rows:
+            devices = []
+            if len(row) > 1 and len(row[1]) > 0:
+                devices = [MAC_TABLE.to_int(element.split(",")[1]) for element in row[1:]]
+
+            data[int(row[0])] = devices
 
     return data
 
@@ -430,7 +439,7 @@ def get_calendar_current_events(main_dir):
 
     data = {}
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
@@ -452,16 +461,13 @@ def get_display_data(main_dir):
 
     data = {}
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
             time = int(row[0])
-            if normalize:
-                # row[1] = display state (0: unknown, 1: sate_off, 2: state_on, 3: state_doze, 4: state_doze_suspend)
-                data[time] = (int(row[1])/4, int(row[2]))
-            else:
-                data[time] = (int(row[1]), int(row[2]))
+            # row[1] = display state (0: unknown, 1: sate_off, 2: state_on, 3: state_doze, 4: state_doze_suspend)
+            data[time] = (int(row[1]), int(row[2]))
 
     return data
 
@@ -476,28 +482,12 @@ def get_location_data(main_dir):
 
     data = {}
 
-    # lat = [-90, 90]
-    max_lat = 90
-    lat_range = 180
-
-    # lat = [-180, 180]
-    max_lng = 180
-    lng_range = 360
-
-    # bearing = [0, 360]
-    max_bearing = 360
-
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
             time = int(row[0])
-            if normalize:
-                # https://developers.google.com/android/reference/com/google/android/gms/maps/model/LatLng
-                data[time] = ((float(row[1]) + max_lat)/lat_range, (float(row[2]) + max_lng)/lng_range, float(row[3]),
-                              float(row[4]), float(row[5])/max_bearing, float(row[6]))
-            else:
-                data[time] = (float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]), float(row[6]))
+            data[time] = (float(row[1]), float(row[2]), float(row[3]), float(row[4]), float(row[5]), float(row[6]))
 
     return data
 
@@ -512,7 +502,7 @@ def get_wifi_p2p_data(main_dir):
 
     data = {}
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
@@ -523,41 +513,135 @@ def get_wifi_p2p_data(main_dir):
             for device in row:
                 if device != row[0]:
                     if(len(device)) > 0:
-                        if normalize:
-                            devices.append(normalize_mac(device))
-                        else:
-                            devices.append(mac_to_int(device))
+                        devices.append(MAC_TABLE.to_int(device))
 
             data[time] = devices
 
     return data
 
 
+'''=====================================================================================================================
+SENSORS
+====================================================================================================================='''
+
+# Maximum size of the raw text parsed at once: sensors files are read one block of lines at a time
+SENSOR_CHUNK_BYTES = 16 * 1024 * 1024
+
+# Every sensor dimension is a block of 14 values, the first 8 of which are kept
+SENSOR_BLOCK = 14
+SENSOR_VALUES = 8
+
+
+def read_sensor_data(file_name, columns, budget=SENSOR_CHUNK_BYTES):
+    """ Parses a sensors file (one timestamp and a fixed number of values per line) into a TimeSeries of float rows.
+    columns(width) returns the indices of the values kept and of the values checked, for a line of width values:
+    lines whose checked values are all the same are skipped.
+
+    The file is read in blocks of at most budget bytes, and every block is converted at once to a float array. A
+    compressed file is decompressed in a background thread while the blocks are parsed.
+    """
+
+    times = []
+    values = []
+
+    with open_raw(file_name, 'rb', threaded=True) as f:
+        rest = b''
+
+        for block in iter(lambda: f.read(budget), b''):
+            block = rest + block
+
+            # Only complete lines are parsed, the last partial one is kept for the next block
+            end = block.rfind(b'\n') + 1
+            rest = block[end:]
+
+            if end > 0:
+                block_times, block_values = parse_sensor_block(block[:end], columns)
+                times.append(block_times)
+                values.append(block_values)
+
+        if len(rest.strip()) > 0:
+            block_times, block_values = parse_sensor_block(rest + b'\n', columns)
+            times.append(block_times)
+            values.append(block_values)
+
+    if len(times) == 0:
+        return TimeSeries(np.empty(0, dtype=np.int64), np.empty((0, 0)))
+
+    # Blocks are float matrices, unless their lines have different lengths (lists of rows)
+    matrices = [block_values for block_values in values if len(block_values) > 0]
+
+    if all(isinstance(m, np.ndarray) for m in matrices) and len(set(m.shape[1] for m in matrices)) <= 1:
+        values = np.concatenate(matrices) if len(matrices) > 0 else np.empty((0, 0))
+    else:
+        values = [row for block_values in values for row in block_values]
+
+    return TimeSeries.from_arrays(np.concatenate(times), values)
+
+
+def parse_sensor_block(block, columns):
+    """ Returns (times, values) for the complete lines of block. Lines normally have the same number of values, and
+    are parsed with a single np.fromstring call (values is a matrix); blocks with lines of different lengths are parsed
+    line by line (values is a list of rows).
+    """
+
+    characters = np.frombuffer(block, dtype=np.uint8)
+
+    line_ends = np.flatnonzero(characters == ord('\n'))
+    tabs = np.flatnonzero(characters == ord('\t'))
+
+    widths = np.diff(np.searchsorted(tabs, line_ends), prepend=0)
+
+    if len(widths) > 0 and (widths == widths[0]).all():
+        numbers = np.fromstring(block, dtype=np.float64, sep=' ')
+
+        if len(numbers) == len(widths) * (widths[0] + 1):
+            matrix = numbers.reshape(len(widths), -1)
+
+            keep, check = columns(int(widths[0]))
+            checked = matrix[:, 1 + check]
+            valid = (checked != checked[:, :1]).any(axis=1)
+
+            return matrix[valid, 0].astype(np.int64), matrix[valid][:, 1 + keep]
+
+    times = []
+    values = []
+
+    for line in block.split(b'\n'):
+        if len(line.strip()) == 0:
+            continue
+
+        row = line.split(b'\t')
+        raw_sensor_data = np.array([float(a) for a in row[1:]])
+
+        keep, check = columns(len(raw_sensor_data))
+
+        if len(set(raw_sensor_data[check].tolist())) > 1:
+            times.append(int(row[0]))
+            values.append(raw_sensor_data[keep])
+
+    if len(set(len(v) for v in values)) == 1:
+        values = np.array(values)
+
+    return np.array(times, dtype=np.int64), values
+
+
 '''=====================================================================================================================
 ENVIRONMENT SENSORS
 ====================================================================================================================='''
 
 
-def get_environment_data(main_dir):
-    file_name = main_dir + '/environment_sensors.csv'
+def environment_columns(width):
 
-    data = {}
+    # Keep only light data (second sensor)
+    light = np.arange(SENSOR_BLOCK, min(SENSOR_BLOCK + SENSOR_VALUES, width))
 
-    with open(file_name) as csvfile:
-        rows = csv.reader(csvfile, delimiter='\t')
+    return light, light
 
-        for row in rows:
-            time = int(row[0])
-            raw_sensor_data = row[1:]
-            sensors = [raw_sensor_data[x:x + 14] for x in range(0, len(raw_sensor_data), 14)]
-            # Keep only light data
-            raw_sensor_data = sensors[1]
-            raw_sensor_data = raw_sensor_data[:8]
-            raw_sensor_data = [float(a) for a in raw_sensor_data]
-            if len(set(raw_sensor_data)) > 1:
-                data[time] = raw_sensor_data
 
-    return data
+def get_environment_data(main_dir):
+    file_name = main_dir + '/environment_sensors.csv'
+
+    return read_sensor_data(file_name, environment_columns)
 
 
 '''=====================================================================================================================
@@ -565,33 +649,28 @@ MOTION SENSORS
 ====================================================================================================================='''
 
 
-def get_motion_data(main_dir):
-    file_name = main_dir + '/motion_sensors.csv'
+def motion_columns(width):
 
-    data = {}
+    # Sensors of 3 dimensions (42 values): the first values of every dimension
+    sensor_size = 3 * SENSOR_BLOCK
 
-    with open(file_name) as csvfile:
-        rows = csv.reader(csvfile, delimiter='\t')
+    columns = []
 
-        for row in rows:
-            time = int(row[0])
+    for sensor in range(0, width, sensor_size):
+        size = min(sensor_size, width - sensor)
 
-            raw_sensor_data = row[1:]
-            raw_sensor_data = [float(a) for a in raw_sensor_data]
+        for dim in range(0, size, SENSOR_BLOCK):
+            columns.extend(range(sensor + dim, sensor + dim + min(SENSOR_VALUES, size - dim)))
 
-            sensors = [raw_sensor_data[x:x + 42] for x in range(0, len(raw_sensor_data), 42)]
-            raw_sensor_data = []
+    columns = np.array(columns, dtype=np.int64)
 
-            for sensor in sensors:
-                dimensions = [sensor[x:x + 14] for x in range(0, len(sensor), 14)]
+    return columns, columns
 
-                for dim in dimensions:
-                    raw_sensor_data.extend(dim[:8])
 
-            if len(set(raw_sensor_data)) > 1:
-                data[time] = raw_sensor_data
+def get_motion_data(main_dir):
+    file_name = main_dir + '/motion_sensors.csv'
 
-    return data
+    return read_sensor_data(file_name, motion_columns)
 
 
 '''=====================================================================================================================
@@ -599,26 +678,18 @@ POSITION SENSORS
 ====================================================================================================================='''
 
 
-def get_position_sensor_data(main_dir):
-    file_name = main_dir + '/position_sensors.csv'
+def position_columns(width):
 
-    data = {}
+    # Keep only data related to the Proximity sensor (last block), checking all its values
+    proximity = np.arange(max(0, width - SENSOR_BLOCK), width)
 
-    with open(file_name) as csvfile:
-        rows = csv.reader(csvfile, delimiter='\t')
+    return proximity[:SENSOR_VALUES], proximity
 
-        for row in rows:
-            time = int(row[0])
-
-            raw_sensor_data = row[1:]
-            raw_sensor_data = [float(a) for a in raw_sensor_data]
-            # Keep only data related to the Proximity sensor
-            raw_sensor_data = raw_sensor_data[-14:]
 
-            if len(set(raw_sensor_data)) > 1:
-                data[time] = raw_sensor_data[:8]
+def get_position_sensor_data(main_dir):
+    file_name = main_dir + '/position_sensors.csv'
 
-    return data
+    return read_sensor_data(file_name, position_columns)
 
 
 '''=====================================================================================================================
@@ -626,42 +697,69 @@ WIFI
 ====================================================================================================================='''
 
 
+# Access points of every scan kept as features: (BSSID, signal level, connected, configured) of the strongest ones
+TOP_WIFI_APS = len(WIFI_HEADER) // 4
+
+
 def get_wifi_data(main_dir):
+    """ Returns the scans as a TimeSeries of float rows (WIFI_HEADER): BSSID, signal level, connected and configured
+    of the TOP_WIFI_APS access points with the highest signal level (in file order for the same level), padded with
+    zeros.
+    """
+
     file_name = main_dir + '/wifi_scans.csv'
 
-    data = {}
+    times = []
+    scans = []
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
-            time = int(row[0])
+            times.append(int(row[0]))
 
             devices = []
 
-            for device in row:
-                if device != row[0] and len(device) > 0:
-                    bssid = device.split(",")[1]
-                    signal = int(device.split(",")[2])
-                    dbm = device.split(",")[3]
+            for device in row[1:]:
+                if len(device) > 0:
+                    fields = device.split(",")
+
+                    bssid = MAC_TABLE.to_int(fields[1])
+                    signal = int(fields[2])
 
                     # False = 0.5, because 0 means MISSING VALUE
                     connected = 0.5
-                    if device.split(",")[5] == "true":
+                    if fields[5] == "true":
                         connected = 1
                     configured = 0.5
-                    if device.split(",")[6] == "true":
+                    if fields[6] == "true":
                         configured = 1
 
-                    if normalize:
-                        bssid = normalize_mac(bssid)
-                        # Max signal level = 4
-                        devices.append((bssid, signal/4, dbm, connected, configured))
-                    else:
-                        bssid = mac_to_int(bssid)
-                        devices.append((bssid, signal, dbm, connected, configured))
+                    devices.append((bssid, signal, connected, configured))
 
-            data[time] = devices
+            scan = [0] * len(WIFI_HEADER)
+
+            for i, device in enumerate(heapq.nlargest(TOP_WIFI_APS, devices, key=lambda device: device[1])):
+                scan[4 * i:4 * i + 4] = device
+
+            scans.append(scan)
+
+    return TimeSeries.from_arrays(times, np.array(scans, dtype=np.float64).reshape(len(times), len(WIFI_HEADER)))
+
+
+def get_wifi_devices(main_dir):
+    """ Returns the BSSIDs of all the access points of every scan (see windows.py).
+    """
+
+    file_name = main_dir + '/wifi_scans.csv'
+
+    data = {}
+
+    with open_raw(file_name) as csvfile:
+        rows = csv.reader(csvfile, delimiter='\t')
+
+        for row in rows:
+            data[int(row[0])] = [MAC_TABLE.to_int(device.split(",")[1]) for device in row[1:] if len(device) > 0]
 
     return data
 
@@ -676,7 +774,7 @@ def get_visible_cells(main_dir):
 
     data = {}
 
-    with open(file_name) as csvfile:
+    with open_raw(file_name) as csvfile:
         rows = csv.reader(csvfile, delimiter='\t')
 
         for row in rows:
@@ -686,7 +784,7 @@ def get_visible_cells(main_dir):
             if row[1] != "":
                 for element in row:
                     if element != row[0]:
-                        cells.append((element.split(",")[0], element.split(",")[1], element.split(",")[2]))
+                        cells.append(tuple(element.split(",")[:3]))
 
             data[time] = cells
 
@@ -703,8 +801,8 @@ def get_multimedia_data(main_dir):
 
     data = {}
 
-    if os.path.isfile(file_name):
-        with open(file_name) as csvfile:
+    if os.path.isfile(find_raw_file(file_name)):
+        with open_raw(file_name) as csvfile:
             rows = csv.reader(csvfile, delimiter='\t')
 
             for row in rows:
@@ -718,10 +816,7 @@ def get_multimedia_data(main_dir):
                 elif ".avi" in row[1] or ".mp4" in row[1]:
                     file_type = 2
 
-                if normalize:
-                    data[int(row[0])] = file_type/2
-                else:
-                    data[int(row[0])] = file_type
+                data[int(row[0])] = file_type
 
     return data
 
@@ -731,30 +826,123 @@ MULTIMEDIA DATA
 ====================================================================================================================='''
 
 
-def load_data(user_dir, google, norm):
-
-    global normalize
-    normalize = norm
-
-    audio_features = get_audio_features(user_dir)
-    battery_features = get_battery_features(user_dir)
-    activity_rec_data = get_activity_recognition_data(user_dir)
-    running_apps = get_running_apps_frequency(google, user_dir)
-    #running_apps = get_running_apps(google, user_dir)
-    bt_conn = get_bt_conn(user_dir)
-    bt_scans = get_bt_scans(user_dir)
-    current_events = get_calendar_current_events(user_dir)
-    visible_cells = get_visible_cells(user_dir)
-    display_status = get_display_data(user_dir)
-    location_data = get_location_data(user_dir)
-    weather_info = get_weather_info(user_dir)
-    wifi_p2p = get_wifi_p2p_data(user_dir)
-    wifi = get_wifi_data(user_dir)
-    environment_data = get_environment_data(user_dir)
-    motion_data = get_motion_data(user_dir)
-    position_sensor_data = get_position_sensor_data(user_dir)
-    multimedia_data = get_multimedia_data(user_dir)
-
-    return audio_features, battery_features, activity_rec_data, bt_conn, bt_scans, current_events, visible_cells,\
-           display_status, location_data, weather_info, wifi_p2p, wifi, environment_data, motion_data,\
-           position_sensor_data, multimedia_data, running_apps
\ No newline at end of file
+# Streams returned by load_data, in order: (name, file, reader, needs_google). Readers flagged with True also take the
+# GooglePlayStore instance.
+STREAMS = [
+    ('audio_features', 'audio.csv', get_audio_features, False),
+    ('battery_features', 'battery.csv', get_battery_features, False),
+    ('activity_rec_data', 'activity.csv', get_activity_recognition_data, False),
+    ('bt_conn', 'bt_conn.csv', get_bt_conn, False),
+    ('bt_scans', 'bt_scan.csv', get_bt_scans, False),
+    ('current_events', 'calendar_current_events.csv', get_calendar_current_events, False),
+    ('visible_cells', 'cells.csv', get_visible_cells, False),
+    ('display_status', 'display.csv', get_display_data, False),
+    ('location_data', 'location.csv', get_location_data, False),
+    ('weather_info', 'weather.csv', get_weather_info, False),
+    ('wifi_p2p', 'wifi_p2p_scans.csv', get_wifi_p2p_data, False),
+    ('wifi', 'wifi_scans.csv', get_wifi_data, False),
+    ('environment_data', 'environment_sensors.csv', get_environment_data, False),
+    ('motion_data', 'motion_sensors.csv', get_motion_data, False),
+    ('position_sensor_data', 'position_sensors.csv', get_position_sensor_data, False),
+    ('multimedia_data', 'multimedia.csv', get_multimedia_data, False),
+    ('running_apps', 'running_apps.csv', get_running_apps_frequency, True),
+    #('running_apps', 'running_apps.csv', get_running_apps, True),
+    ('wifi_devices', 'wifi_scans.csv', get_wifi_devices, False),
+    ('bt_scan_devices', 'bt_scan.csv', get_bt_scan_devices, False),
+]
+
+
+def read_stream(index, user_dir, google, cache=False):
+
+    name, file, read, needs_google = STREAMS[index]
+
+    wall = time.perf_counter()
+    cpu = time.process_time()
+
+    if cache:
+        extra = google_fingerprint(google) if needs_google else None
+        key = stream_cache.stream_key(find_raw_file(user_dir + '/' + file), extra)
+        cache_dir = stream_cache.stream_cache_dir(user_dir, name)
+
+        series = stream_cache.load(cache_dir, key)
+        if series is not None:
+            REPORT.count('stream_cache_hits')
+            REPORT.add_stream(name, len(series), time.perf_counter() - wall, time.process_time() - cpu, cached=1)
+            return series
+
+        REPORT.count('stream_cache_misses')
+
+    if needs_google:
+        series = read(google, user_dir)
+    else:
+        series = read(user_dir)
+
+    if not isinstance(series, TimeSeries):
+        series = TimeSeries.from_dict(series)
+
+    if cache:
+        stream_cache.save(cache_dir, key, series)
+
+    REPORT.add_stream(name, len(series), time.perf_counter() - wall, time.process_time() - cpu)
+
+    return series
+
+
+def read_stream_in_worker(index, user_dir, google, cache=False):
+    """ read_stream in a worker process: returns the stream and the report (instrumentation) of the read.
+    """
+
+    REPORT.reset()
+
+    series = read_stream(index, user_dir, google, cache)
+
+    return series, REPORT
+
+
+def google_fingerprint(google):
+    """ Digest of the Play Store data (categories and known apps) the running apps stream depends on.
+    """
+
+    return hashlib.sha1('\t'.join(str(x) for x in google.fingerprint()).encode()).hexdigest()
+
+
+def stream_file_size(user_dir, index):
+
+    file_name = find_raw_file(user_dir + '/' + STREAMS[index][1])
+
+    if os.path.isfile(file_name):
+        return os.path.getsize(file_name)
+
+    return 0
+
+
+def load_data(user_dir, google, jobs=1, cache=False, groups=None):
+    """ Returns the streams listed in STREAMS, each one as a TimeSeries of raw values (see scaler.py for their
+    normalization). With groups, only the streams needed by those
+    feature groups (see utils.FEATURE_GROUPS) are parsed, the others are None. With jobs > 1 the files are parsed
+    concurrently on a pool of processes, largest files first. With cache, parsed streams are persisted in (and loaded
+    from) the binary cache of stream_cache.py.
+    """
+
+    selected = range(len(STREAMS))
+
+    if groups is not None:
+        required = get_feature_groups_streams(groups)
+        selected = [i for i in selected if STREAMS[i][0] in required]
+
+    if jobs <= 1:
+        streams = {i: read_stream(i, user_dir, google, cache) for i in selected}
+
+    else:
+        order = sorted(selected, key=lambda i: stream_file_size(user_dir, i), reverse=True)
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {i: executor.submit(read_stream_in_worker, i, user_dir, google, cache) for i in order}
+
+            streams = {}
+
+            for i in selected:
+                streams[i], report = futures[i].result()
+                REPORT.merge(report)
+
+    return tuple(streams.get(i) for i in range(len(STREAMS)))
@@ -0,0 +1,166 @@
+import json
+
+import numpy as np
+
+from utils import MAX_MAC, AUDIO_HEADER, DISPLAY_HEADER, BATTERY_HEADER, ACTIVITY_REC_HEADER, BT_CON_HEADER, \
+    BT_SCAN_HEADER, MULTIMEDIA_HEADER, LOCATION_HEADER, WEATHER_HEADER, WIFI_P2P_HEADER, WIFI_HEADER, WINDOW_HEADER
+from sensor_normalizer import range_columns
+from windows import WINDOW_MILLIS
+
+'''
+Normalization of the dataset features: every scaled column is transformed with
+
+    x' = (x - shift) / scale
+
+The streams are always parsed raw, and the rows are scaled when they are written (see ScalingWriter), so the same
+parsed data gives raw and normalized datasets. The parameters of a build are saved in a small JSON file (scaler.json,
+{"columns": {column: [shift, scale]}}), keyed by column name, which can be reused to normalize new data exactly as the
+training data. The time features are not part of the scaler: they are computed already normalized (time_features).
+'''
+
+SCALER_FILE = 'scaler.json'
+
+# Max BT Major device class is "Uncategorized" = 7936
+# https://developer.android.com/reference/android/bluetooth/BluetoothClass.Device.Major.html
+BT_MAX_MAJOR_CLASS = 7936
+
+# Default parameters, from the known ranges of the raw values: column -> (shift, scale)
+DEFAULT_SCALING = {
+    # ring_mode (0: silent, 1: vibrate, 2: normal)
+    AUDIO_HEADER[0]: (0, 2),
+    # display state (0: unknown, 1: sate_off, 2: state_on, 3: state_doze, 4: state_doze_suspend)
+    DISPLAY_HEADER[0]: (0, 4),
+    BATTERY_HEADER[1]: (0, 4),
+    # file type (0: none, 1: image, 2: video)
+    MULTIMEDIA_HEADER[0]: (0, 2),
+    # lat = [-90, 90], lon = [-180, 180], bearing = [0, 360]
+    # https://developers.google.com/android/reference/com/google/android/gms/maps/model/LatLng
+    LOCATION_HEADER[0]: (-90, 180),
+    LOCATION_HEADER[1]: (-180, 360),
+    LOCATION_HEADER[2]: (0, 360),
+    # http://www.openweathermap.com/current
+    WEATHER_HEADER[0]: (0, 962),
+    # temp = [-50, 50]
+    WEATHER_HEADER[1]: (-50, 100),
+    WEATHER_HEADER[2]: (-50, 100),
+    WEATHER_HEADER[3]: (-50, 100),
+    WEATHER_HEADER[4]: (0, 100),
+    # wind speed = [0, 100] m/s
+    WEATHER_HEADER[6]: (0, 100),
+    # wind direction http://snowfence.umn.edu/Components/winddirectionanddegreeswithouttable3.htm
+    WEATHER_HEADER[7]: (0, 348.75),
+    WEATHER_HEADER[8]: (0, 100),
+    # single running app category (reader.get_running_apps)
+    'running_app': (0, 59),
+    # seconds of the window (the other window features have no known range: see sensor_normalizer.FITTED_COLUMNS)
+    WINDOW_HEADER[3]: (0, WINDOW_MILLIS / 1000),
+}
+
+DEFAULT_SCALING.update({column: (0, 100) for column in ACTIVITY_REC_HEADER})
+DEFAULT_SCALING.update({column: (0, MAX_MAC) for column in BT_CON_HEADER + BT_SCAN_HEADER
+                        if column.endswith('_address')})
+DEFAULT_SCALING.update({column: (0, BT_MAX_MAJOR_CLASS) for column in BT_CON_HEADER + BT_SCAN_HEADER
+                        if column.endswith('_major_class')})
+DEFAULT_SCALING.update({column: (0, MAX_MAC) for column in WIFI_P2P_HEADER})
+DEFAULT_SCALING.update({column: (0, MAX_MAC) for column in WIFI_HEADER if column.endswith('_bssid')})
+# Max signal level = 4
+DEFAULT_SCALING.update({column: (0, 4) for column in WIFI_HEADER if column.endswith('_signal_level')})
+
+
+class Scaler:
+    """ Scaling parameters of the columns of a dataset header (columns without parameters are left as they are).
+    """
+
+    def __init__(self, header, params=None):
+
+        self.header = header.split(',')
+        self.params = {}
+
+        if params is not None:
+            self.params.update({column: tuple(params[column]) for column in self.header if column in params})
+
+        self.update_columns()
+
+    @classmethod
+    def default(cls, header):
+        return cls(header, DEFAULT_SCALING)
+
+    @classmethod
+    def load(cls, file_name, header):
+
+        with open(file_name) as f:
+            return cls(header, json.load(f)['columns'])
+
+    def save(self, file_name):
+
+        with open(file_name, 'w') as f:
+            json.dump({'columns': {column: list(self.params[column]) for column in self.header
+                                   if column in self.params}}, f)
+
+    def update_columns(self):
+
+        self.columns = [i for i, column in enumerate(self.header) if column in self.params]
+        self.shift = np.array([self.params[self.header[i]][0] for i in self.columns], dtype=np.float64)
+        self.factor = np.array([self.params[self.header[i]][1] for i in self.columns], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def fit_sensors(self, ranges):
+        """ Sets the parameters of the sensors (and fitted) columns from their ranges (sensor_normalizer.SensorRanges).
+        """
+
+        for sensor, (low, high) in ranges.to_dict().items():
+            for column in range_columns(sensor):
+                self.params[column] = (low, high - low)
+
+        self.update_columns()
+
+    def scale(self, values):
+        """ Scales the values of the scaled columns (one row per example, one column per element of columns). As in
+        normalize_sensors_data.R, an empty range gives NaN or infinite values.
+        """
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (np.asarray(values, dtype=np.float64) - self.shift) / self.factor
+
+    def transform(self, rows):
+        """ Scales a block of dataset rows: float matrix (scaled in place) or list of rows (the scaled columns are
+        replaced with floats).
+        """
+
+        if len(self) == 0 or len(rows) == 0:
+            return rows
+
+        if isinstance(rows, np.ndarray):
+            rows[:, self.columns] = self.scale(rows[:, self.columns])
+            return rows
+
+        values = self.scale([[row[i] for i in self.columns] for row in rows])
+
+        for row, row_values in zip(rows, values.tolist()):
+            for i, value in zip(self.columns, row_values):
+                row[i] = value
+
+        return rows
+
+
+class ScalingWriter:
+    """ Dataset writer that scales the rows before writing them.
+    """
+
+    def __init__(self, writer, scaler):
+        self.writer = writer
+        self.scaler = scaler
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, rows, labels):
+        self.writer.write(self.scaler.transform(rows), labels)
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,125 @@
+import numpy as np
+
+from utils import ENVIRONMENT_SENSORS_HEADER, MOTION_SENSORS_HEADER, POSITION_SENSORS_HEADER, WINDOW_HEADER
+
+'''
+Rescaling of the sensors features of a dataset (formerly done by normalize_sensors_data.R). Every sensor has 8
+columns (SENSOR_STATS), all rescaled with the same range:
+
+    x' = (x - min(<sensor>_min)) / (max(<sensor>_max) - min(<sensor>_min))
+
+where the minimum and maximum are taken over all the rows of the dataset. The ranges are tracked while the rows are
+written (SensorRanges.update), and applied when the rows are copied to the final dataset (see the writers merge).
+
+The features with no known range (FITTED_COLUMNS) are rescaled the same way, each column with its own range.
+'''
+
+SENSOR_STATS = ["min", "max", "mean", "quadratic_mean", "25_percentile", "50_percentile", "75_percentile",
+                "100_percentile"]
+
+SENSORS = [name[:-len("_min")] for name in ENVIRONMENT_SENSORS_HEADER + MOTION_SENSORS_HEADER + POSITION_SENSORS_HEADER
+           if name.endswith("_min")]
+
+# Window features (windows.py) without a known range: distinct Wi-Fi access points and BT devices, battery slope
+FITTED_COLUMNS = WINDOW_HEADER[:3]
+
+
+def range_columns(name):
+    """ Returns the columns rescaled with the range of name (a sensor or a fitted column).
+    """
+
+    if name in FITTED_COLUMNS:
+        return [name]
+
+    return [name + "_" + stat for stat in SENSOR_STATS]
+
+
+class SensorRanges:
+    """ Ranges of the sensors and fitted columns of a dataset header (those that are not in the header are ignored).
+    """
+
+    def __init__(self, header, ranges=None):
+
+        columns = header.split(',')
+
+        self.sensors = [sensor for sensor in SENSORS if sensor + "_min" in columns] + \
+            [column for column in FITTED_COLUMNS if column in columns]
+
+        # Columns of every sensor (in the order of SENSOR_STATS: the range is the min of the first one and the max of
+        # the second one) or fitted column
+        self.sensor_columns = [[columns.index(column) for column in range_columns(sensor)] for sensor in self.sensors]
+        self.columns = [column for sensor_columns in self.sensor_columns for column in sensor_columns]
+        self.widths = [len(sensor_columns) for sensor_columns in self.sensor_columns]
+
+        self.low = np.full(len(self.sensors), np.inf)
+        self.high = np.full(len(self.sensors), -np.inf)
+
+        if ranges is not None:
+            for i, sensor in enumerate(self.sensors):
+                if sensor in ranges:
+                    self.low[i], self.high[i] = ranges[sensor]
+
+    def __len__(self):
+        return len(self.sensors)
+
+    def update(self, rows):
+        """ Extends the ranges with a block of dataset rows (matrix or list of rows).
+        """
+
+        if len(self) == 0 or len(rows) == 0:
+            return
+
+        low_columns = [columns[0] for columns in self.sensor_columns]
+        high_columns = [columns[min(1, len(columns) - 1)] for columns in self.sensor_columns]
+
+        if isinstance(rows, np.ndarray):
+            low = rows[:, low_columns]
+            high = rows[:, high_columns]
+        else:
+            low = np.array([[row[i] for i in low_columns] for row in rows], dtype=np.float64)
+            high = np.array([[row[i] for i in high_columns] for row in rows], dtype=np.float64)
+
+        self.low = np.minimum(self.low, low.min(axis=0))
+        self.high = np.maximum(self.high, high.max(axis=0))
+
+    def merge(self, other):
+
+        self.low = np.minimum(self.low, other.low)
+        self.high = np.maximum(self.high, other.high)
+
+    def to_dict(self):
+        return {sensor: [low, high] for sensor, low, high in zip(self.sensors, self.low.tolist(), self.high.tolist())}
+
+    def scale(self, values):
+        """ Rescales the values of the sensors columns (values: one row per example, one column per element of
+        columns). As in R, a sensor with an empty range gives NaN or infinite values.
+        """
+
+        low = np.repeat(self.low, self.widths)
+        high = np.repeat(self.high, self.widths)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (np.asarray(values, dtype=np.float64) - low) / (high - low)
+
+
+class TrackingWriter:
+    """ Dataset writer that also tracks the sensors ranges of the rows written.
+    """
+
+    def __init__(self, writer, ranges):
+        self.writer = writer
+        self.ranges = ranges
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, rows, labels):
+
+        self.ranges.update(rows)
+        self.writer.write(rows, labels)
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from timeseries import TimeSeries
+
+'''
+Binary cache of the parsed streams. Every stream returned by reader.load_data is stored in its own directory, next to
+the raw data (<user_dir>/.cache/<stream>), as plain .npy files that are memory-mapped when loaded:
+
+    - times.npy         int64 timestamps
+    - values.npy        typed values (see encode_values)
+    - offsets.npy       row boundaries of values.npy, for streams whose rows are lists of devices
+    - meta.json         cache key and layout of the values
+
+The cache key is made of the size, modification time and SHA-1 of the source file, plus any other input the parsed
+values depend on and the version of the layout. Streams are parsed raw, so the same entry serves raw and normalized
+builds. A stale or missing entry is simply rebuilt by the caller.
+'''
+
+CACHE_DIR = '.cache'
+
+# Bumped whenever the layout of a parsed stream changes
+CACHE_VERSION = 5
+
+
+def file_fingerprint(file_name):
+
+    if not os.path.isfile(file_name):
+        return None
+
+    sha1 = hashlib.sha1()
+
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+
+    stat = os.stat(file_name)
+
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': sha1.hexdigest()}
+
+
+def stream_key(file_name, extra=None):
+
+    return {'file': os.path.basename(file_name), 'source': file_fingerprint(file_name), 'extra': extra,
+            'version': CACHE_VERSION}
+
+
+def stream_cache_dir(user_dir, name):
+
+    return os.path.join(user_dir, CACHE_DIR, name)
+
+
+def load(cache_dir, key):
+    """ Returns the cached TimeSeries if its key matches, None otherwise.
+    """
+
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get('key') != key:
+        return None
+
+    times = np.load(os.path.join(cache_dir, 'times.npy'), mmap_mode='r')
+    values = np.load(os.path.join(cache_dir, 'values.npy'), mmap_mode='r')
+
+    offsets = None
+    if meta['kind'] == 'ragged':
+        offsets = np.load(os.path.join(cache_dir, 'offsets.npy'), mmap_mode='r')
+
+    return TimeSeries(times, decode_values(meta, values, offsets))
+
+
+def save(cache_dir, key, series):
+
+    meta, values, offsets = encode_values(series.values)
+    meta['key'] = key
+
+    tmp_dir = cache_dir + '.tmp-' + str(os.getpid())
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, 'times.npy'), np.asarray(series.times, dtype=np.int64))
+    np.save(os.path.join(tmp_dir, 'values.npy'), values)
+    if offsets is not None:
+        np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+
+    # meta.json is written last: an entry without it is never considered valid
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+
+
+'''=====================================================================================================================
+VALUES LAYOUT
+====================================================================================================================='''
+
+
+def field_dtype(column):
+
+    if all(isinstance(x, str) for x in column):
+        return 'U' + str(max([len(x) for x in column] + [1]))
+
+    if all(isinstance(x, int) for x in column):
+        return 'i8'
+
+    return 'f8'
+
+
+def records_array(records, width):
+
+    columns = [[record[i] for record in records] for i in range(width)]
+    dtype = [('f' + str(i), field_dtype(column)) for i, column in enumerate(columns)]
+
+    return np.array([tuple(record) for record in records], dtype=dtype)
+
+
+def encode_values(values):
+    """ Returns (meta, values, offsets) where values is a typed array. The layout depends on the stream:
+
+        - array:    the values already are a numpy array
+        - scalar:   one number or string per row
+        - record:   one fixed-width tuple or list per row (structured array, one field per column)
+        - ragged:   one variable-length list per row (e.g. visible devices): the elements of all rows are concatenated
+                    and offsets holds the boundaries of each row
+    """
+
+    if isinstance(values, np.ndarray):
+        return {'kind': 'array'}, values, None
+
+    values = list(values)
+
+    if all(not isinstance(v, (tuple, list)) for v in values):
+        return {'kind': 'scalar'}, np.array(values, dtype=field_dtype(values)), None
+
+    container = 'tuple' if isinstance(values[0], tuple) else 'list'
+
+    if len(set(len(v) for v in values)) == 1 and len(values[0]) > 0 \
+            and all(not isinstance(x, (tuple, list)) for x in values[0]):
+        return {'kind': 'record', 'container': container}, records_array(values, len(values[0])), None
+
+    elements = [x for v in values for x in v]
+    offsets = np.cumsum([0] + [len(v) for v in values], dtype=np.int64)
+
+    if len(elements) > 0 and all(isinstance(x, tuple) for x in elements) and len(set(len(x) for x in elements)) == 1:
+        return {'kind': 'ragged', 'container': container}, records_array(elements, len(elements[0])), offsets
+
+    return {'kind': 'ragged', 'container': container}, np.array(elements, dtype=field_dtype(elements)), offsets
+
+
+def decode_values(meta, values, offsets):
+
+    kind = meta['kind']
+
+    if kind == 'array':
+        return values
+
+    if kind == 'scalar':
+        return ScalarValues(values)
+
+    container = tuple if meta['container'] == 'tuple' else list
+
+    if kind == 'record':
+        return RecordValues(values, container)
+
+    return RaggedValues(values, offsets, container)
+
+
+class ScalarValues:
+
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i].item()
+
+    def __iter__(self):
+        return iter(self.values.tolist())
+
+
+class RecordValues:
+
+    def __init__(self, values, container):
+        self.values = values
+        self.container = container
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.container(self.values[i].tolist())
+
+    def __iter__(self):
+        return (self.container(record) for record in self.values.tolist())
+
+
+class RaggedValues:
+
+    def __init__(self, values, offsets, container):
+        self.values = values
+        self.offsets = offsets
+        self.container = container
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.container(self.values[self.offsets[i]:self.offsets[i + 1]].tolist())
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
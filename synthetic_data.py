@@ -0,0 +1,239 @@
+#!venv/bin/python
+
+import argparse
+import os
+import random
+
+from utils import RUNNING_APPS_HEADER
+
+'''
+Generator of synthetic user directories, with the same files and TSV layouts reader.py expects, for benchmarks and
+experiments that cannot use real recordings. Every stream is sampled with its own period (millis, with some jitter),
+and a Google Play Store directory (known apps and categories) is generated with it.
+'''
+
+START_TIME = 1520515827838
+
+# Sampling period of every file (millis)
+SAMPLING_PERIODS = {
+    'activity.csv': 60000,
+    'audio.csv': 120000,
+    'battery.csv': 90000,
+    'bt_conn.csv': 300000,
+    'bt_scan.csv': 60000,
+    'calendar_current_events.csv': 600000,
+    'cells.csv': 120000,
+    'display.csv': 30000,
+    'location.csv': 120000,
+    'weather.csv': 1800000,
+    'wifi_p2p_scans.csv': 120000,
+    'wifi_scans.csv': 60000,
+    'environment_sensors.csv': 60000,
+    'motion_sensors.csv': 20000,
+    'position_sensors.csv': 60000,
+    'running_apps.csv': 60000,
+    'installed_apps.csv': 3600000,
+    'multimedia.csv': 900000,
+}
+
+LABELS = ["HOME", "WORK", "SPORT", "LEISURE", "TRAVEL"]
+
+STORE_CATEGORIES = [column[len("running_apps_"):].upper() for column in RUNNING_APPS_HEADER]
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description='Writes a synthetic user directory.')
+
+    parser.add_argument('-out', dest='outputDir', required=True, help='Output user directory.')
+
+    parser.add_argument('-google', dest='googleDir', required=True,
+                        help='Output directory of the Google Play Store data (known apps and categories).')
+
+    parser.add_argument('-hours', dest='hours', type=float, default=24,
+                        help='Duration of the recordings (default: 24).')
+
+    parser.add_argument('-period', dest='periods', action='append', default=[], metavar='FILE=MILLIS',
+                        help='Sampling period of a file, e.g. motion_sensors.csv=5000 (can be repeated).')
+
+    parser.add_argument('-seed', dest='seed', type=int, default=1, help='Random seed (default: 1).')
+
+    args = parser.parse_args()
+
+    periods = {}
+
+    for period in args.periods:
+        name, millis = period.split('=')
+
+        if name not in SAMPLING_PERIODS:
+            parser.error("unknown file '" + name + "'")
+
+        periods[name] = int(millis)
+
+    args.periods = periods
+
+    return args
+
+
+class UserGenerator:
+
+    def __init__(self, seed=1, packages=200, devices=300):
+
+        self.random = random.Random(seed)
+
+        self.packages = ["com.synthetic.app" + str(i) for i in range(packages)]
+        self.categories = {package: self.random.choice(STORE_CATEGORIES) for package in self.packages}
+
+        # The same devices and access points recur over the whole recording
+        self.macs = [':'.join("%02X" % self.random.randrange(256) for _ in range(6)) for _ in range(devices)]
+
+        self.battery = 100.0
+
+    def write_google_dir(self, google_dir, known=0.9):
+        """ Writes the Play Store categories and the categories of a fraction of the packages (the others are unknown).
+        """
+
+        os.makedirs(google_dir, exist_ok=True)
+
+        with open(google_dir + "/play_store_app_categories.dat", "w") as f:
+            f.write("\n".join(STORE_CATEGORIES) + "\n")
+
+        with open(google_dir + "/known_apps.dat", "w") as f:
+            for package in self.packages[:int(len(self.packages) * known)]:
+                f.write(package + "\t" + self.categories[package] + "\n")
+
+    def write_user_dir(self, user_dir, hours=24, periods=None):
+
+        os.makedirs(user_dir, exist_ok=True)
+
+        start = START_TIME
+        end = START_TIME + int(hours * 3600 * 1000)
+
+        sampling = dict(SAMPLING_PERIODS)
+        sampling.update(periods or {})
+
+        self.write_activities(user_dir + "/activities.csv", start, end)
+
+        for name, row in [('activity.csv', self.activity_row), ('audio.csv', self.audio_row),
+                          ('battery.csv', self.battery_row), ('bt_conn.csv', self.bt_conn_row),
+                          ('bt_scan.csv', self.bt_scan_row), ('calendar_current_events.csv', self.calendar_row),
+                          ('cells.csv', self.cells_row), ('display.csv', self.display_row),
+                          ('location.csv', self.location_row), ('weather.csv', self.weather_row),
+                          ('wifi_p2p_scans.csv', self.wifi_p2p_row), ('wifi_scans.csv', self.wifi_row),
+                          ('environment_sensors.csv', self.sensors_row(56)),
+                          ('motion_sensors.csv', self.sensors_row(210)),
+                          ('position_sensors.csv', self.sensors_row(140)),
+                          ('running_apps.csv', self.running_apps_row), ('installed_apps.csv', self.installed_apps_row),
+                          ('multimedia.csv', self.multimedia_row)]:
+            self.write_stream(user_dir + "/" + name, start, end, sampling[name], row)
+
+    def write_activities(self, file_name, start, end):
+
+        with open(file_name, "w") as f:
+            time = start + 10 * 60000
+
+            while time < end - 20 * 60000:
+                length = self.random.randrange(20 * 60000, 90 * 60000)
+                f.write(str(time) + "\t" + str(min(time + length, end)) + "\t" + self.random.choice(LABELS) + "\n")
+                time = time + length + self.random.randrange(60000, 20 * 60000)
+
+    def write_stream(self, file_name, start, end, period, row, jitter=0.3):
+
+        with open(file_name, "w") as f:
+            time = start - self.random.randrange(period)
+
+            while time < end:
+                f.write("\t".join([str(time)] + row()) + "\n")
+                time = time + max(1, int(period * (1 + self.random.uniform(-jitter, jitter))))
+
+    '''=================================================================================================================
+    ROWS
+    ================================================================================================================='''
+
+    def devices(self, max_devices):
+        return self.random.sample(self.macs, self.random.randrange(max_devices + 1))
+
+    def activity_row(self):
+        return [str(self.random.randrange(101)) for _ in range(8)]
+
+    def audio_row(self):
+        return [str(self.random.randrange(3))] + ["%.2f" % self.random.random() for _ in range(4)] + \
+               [self.random.choice(["true", "false"]) for _ in range(5)]
+
+    def battery_row(self):
+
+        plugged = self.random.random() < 0.2
+        self.battery = min(100.0, self.battery + 1) if plugged else max(1.0, self.battery - 0.2)
+
+        return ["%.1f" % self.battery, str(self.random.choice([1, 2, 4]) if plugged else 0)]
+
+    def bt_conn_row(self):
+        return [",".join(["device", mac, str(self.random.choice([256, 1024, 1792, 7936]))])
+                for mac in self.devices(2)] or [""]
+
+    def bt_scan_row(self):
+        return [",".join(["device", mac, str(self.random.choice([256, 1024, 1792, 7936])),
+                          str(self.random.randrange(-99, -30))]) for mac in self.devices(10)] or [""]
+
+    def calendar_row(self):
+
+        if self.random.random() < 0.3:
+            return ["event", "calendar", "0", "0", "meeting " + str(self.random.randrange(10))]
+
+        return [""]
+
+    def cells_row(self):
+        return [",".join(str(self.random.randrange(1000)) for _ in range(3))
+                for _ in range(self.random.randrange(4))] or [""]
+
+    def display_row(self):
+        return [str(self.random.choice([1, 2, 2, 3])), str(self.random.randrange(4))]
+
+    def location_row(self):
+        return ["%.6f" % self.random.uniform(43.7, 43.8), "%.6f" % self.random.uniform(10.3, 10.5),
+                "%.1f" % self.random.uniform(0, 300), "%.1f" % self.random.uniform(3, 50),
+                "%.1f" % self.random.uniform(0, 360), "%.1f" % self.random.uniform(0, 10)]
+
+    def weather_row(self):
+        return [str(self.random.choice([800, 801, 802, 500, 501]))] + \
+               ["%.2f" % self.random.uniform(5, 30) for _ in range(3)] + \
+               ["%.1f" % self.random.uniform(30, 90), "%.1f" % self.random.uniform(990, 1030),
+                "%.1f" % self.random.uniform(0, 15), "%.1f" % self.random.uniform(0, 348.75),
+                "%.1f" % self.random.uniform(0, 100), "%.0f" % self.random.uniform(0, 1e9),
+                "%.0f" % self.random.uniform(0, 1e9)]
+
+    def wifi_p2p_row(self):
+        return self.devices(3) or [""]
+
+    def wifi_row(self):
+        return [",".join(["network", mac, str(self.random.randrange(5)), str(self.random.randrange(-90, -30)), "2412",
+                          self.random.choice(["true", "false"]), self.random.choice(["true", "false"])])
+                for mac in self.devices(15)] or [""]
+
+    def sensors_row(self, values):
+        return lambda: ["%.3f" % self.random.random() for _ in range(values)]
+
+    def running_apps_row(self):
+        return self.random.sample(self.packages, self.random.randrange(1, 8))
+
+    def installed_apps_row(self):
+        return list(self.packages)
+
+    def multimedia_row(self):
+        return [self.random.choice(["", "IMG_1.jpg", "VID_1.mp4", "notes.txt"])]
+
+
+def generate_user(user_dir, google_dir, hours=24, periods=None, seed=1):
+
+    generator = UserGenerator(seed)
+    generator.write_google_dir(google_dir)
+    generator.write_user_dir(user_dir, hours, periods)
+
+
+if __name__ == '__main__':
+
+    args = parse_arguments()
+
+    generate_user(args.outputDir, args.googleDir, args.hours, args.periods, args.seed)
+
+    print("Synthetic user written in " + args.outputDir + " (Play Store data in " + args.googleDir + ")")
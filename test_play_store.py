@@ -0,0 +1,163 @@
+import http.server
+import threading
+import time
+
+import pytest
+
+from play_store import GooglePlayStore, RateLimiter
+
+'''
+GooglePlayStore.fetch_categories against a local stand-in of the Play Store, serving canned pages by package name:
+
+    flaky*      503 for the first two requests, then a TOOLS page
+    down*       always 503
+    missing*    404
+    nogenre*    page without any genre
+    slow*       TOOLS page, after SLOW_SECONDS
+    other       page with the SOCIAL and TOOLS genres
+'''
+
+SLOW_SECONDS = 1.0
+
+PAGE = '<html><body>{links}</body></html>'
+GENRE_LINK = '<a itemprop="genre" href="/store/apps/category/{genre}">{genre}</a>'
+
+
+def genres_page(genres):
+    return PAGE.format(links=''.join(GENRE_LINK.format(genre=genre) for genre in genres)).encode()
+
+
+class StoreHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+
+        package = self.path.split('id=')[-1]
+
+        with self.server.lock:
+            self.server.hits[package] = self.server.hits.get(package, 0) + 1
+            hits = self.server.hits[package]
+
+        if package.startswith('flaky') and hits <= 2 or package.startswith('down'):
+            self.reply(503)
+        elif package.startswith('missing'):
+            self.reply(404)
+        elif package.startswith('nogenre'):
+            self.reply(200, genres_page([]))
+        elif package.startswith('slow'):
+            time.sleep(SLOW_SECONDS)
+            self.reply(200, genres_page(['TOOLS']))
+        elif package.startswith('flaky'):
+            self.reply(200, genres_page(['TOOLS']))
+        else:
+            self.reply(200, genres_page(['TOOLS', 'SOCIAL']))
+
+    def reply(self, status, body=b''):
+
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StoreHandler)
+    server.daemon_threads = True
+    server.hits = {}
+    server.lock = threading.Lock()
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def new_store(server, out_dir):
+
+    with open(str(out_dir) + '/play_store_app_categories.dat', 'w') as f:
+        f.write('TOOLS\nSOCIAL\n')
+
+    return GooglePlayStore(str(out_dir), store_url='http://127.0.0.1:%d/details?id=' % server.server_address[1])
+
+
+def test_fetch_categories(server, tmp_path):
+
+    google = new_store(server, tmp_path)
+
+    result = google.fetch_categories(['com.app', 'flaky.app', 'down.app', 'missing.app', 'nogenre.app'], workers=4,
+                                     rate=None, retries=3, backoff=0.01, timeout=5)
+
+    assert result == {'com.app': ['SOCIAL', 'TOOLS'], 'flaky.app': ['TOOLS']}
+
+    # 503 pages are retried: the failed package is not stored, 404 and pages without genres are negative entries
+    assert server.hits['flaky.app'] == 3
+    assert server.hits['down.app'] == 4
+
+    store = google.get_store()
+    assert store.get('down.app') is None
+    assert store.get('missing.app')[0] == []
+    assert store.get('nogenre.app')[0] == []
+    assert store.is_fresh('missing.app') and store.is_fresh('nogenre.app')
+
+
+def test_second_run_fetches_failed_packages(server, tmp_path):
+
+    packages = ['com.app', 'down.app', 'missing.app', 'nogenre.app']
+
+    new_store(server, tmp_path).fetch_categories(packages, rate=None, retries=0, timeout=5)
+
+    hits = dict(server.hits)
+
+    # Same store, new instance: only the failed package is fetched again, and the results have the same type
+    result = new_store(server, tmp_path).fetch_categories(packages, rate=None, retries=0, timeout=5)
+
+    assert result == {'com.app': ['SOCIAL', 'TOOLS']}
+    assert {package: server.hits[package] - hits[package] for package in packages} == \
+        {'com.app': 0, 'down.app': 1, 'missing.app': 0, 'nogenre.app': 0}
+
+
+def test_timeout(server, tmp_path):
+
+    google = new_store(server, tmp_path)
+
+    start = time.monotonic()
+    result = google.fetch_categories(['slow.app'], rate=None, retries=0, timeout=0.2)
+
+    assert result == {}
+    assert time.monotonic() - start < SLOW_SECONDS
+    assert google.get_store().get('slow.app') is None
+
+
+def test_rate_limit(server, tmp_path):
+
+    google = new_store(server, tmp_path)
+
+    packages = ['com.app' + str(i) for i in range(10)]
+
+    start = time.monotonic()
+    result = google.fetch_categories(packages, workers=8, rate=20, timeout=5)
+
+    # 10 requests spaced by 1/20 s, whatever the number of workers
+    assert time.monotonic() - start >= 9 / 20
+    assert sorted(result) == packages
+
+
+def test_rate_limiter_spacing():
+
+    limiter = RateLimiter(50)
+
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.wait()
+
+    assert time.monotonic() - start >= 5 / 50
+    assert RateLimiter(None).interval == 0
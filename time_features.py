@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+'''
+Calendar and time-of-day features of an array of millisecond timestamps, computed with datetime64 arithmetic. Times are
+converted to the local time of an explicit time zone (IANA name, e.g. "Europe/Rome"), so the result never depends on
+the time zone of the host.
+'''
+
+DEFAULT_TZ = 'UTC'
+
+MILLIS_PER_DAY = 24 * 60 * 60 * 1000
+
+# UTC offsets are looked up once per 15 minutes interval: time zone transitions happen on these boundaries
+OFFSET_RESOLUTION = 15 * 60 * 1000
+
+# time      0 = morning (5-12)      1 = afternoon (13-16)       2 = evening (17-22)     3 = night (23-4)
+HOUR_SEMANTIC = np.array([3] * 5 + [0] * 8 + [1] * 4 + [2] * 6 + [3], dtype=np.int64)
+
+
+def get_utc_offsets(timestamps, tz=DEFAULT_TZ):
+    """ Returns the UTC offset (millis) of tz at every timestamp.
+    """
+
+    if tz == 'UTC':
+        return np.zeros(len(timestamps), dtype=np.int64)
+
+    zone = ZoneInfo(tz)
+
+    buckets, inverse = np.unique(timestamps // OFFSET_RESOLUTION, return_inverse=True)
+
+    offsets = [datetime.fromtimestamp(bucket * OFFSET_RESOLUTION / 1000, timezone.utc).astimezone(zone).utcoffset()
+               for bucket in buckets.tolist()]
+    offsets = np.array([int(offset.total_seconds() * 1000) for offset in offsets], dtype=np.int64)
+
+    return offsets[inverse.reshape(-1)]
+
+
+def get_time_features(timestamps, normalize, tz=DEFAULT_TZ):
+    """ Returns a dict with one array per time feature (keys are the utils TIME_HEADER names):
+
+        - month             month of the year (0 = January)
+        - week_of_month     week of the month (1 = week of the 1st day of the month)
+        - day_of_month      day of the month (0 = 1st)
+        - day_of_week       day of the week (0 = Monday, 6 = Sunday)
+        - weekday           day type (0 = working day, 1 = weekend)
+        - time              seconds since midnight / seconds in a day (23:59:59 = 1)
+        - time_type         0 = morning, 1 = afternoon, 2 = evening, 3 = night
+
+    With normalize, month, week_of_month, day_of_month, day_of_week and time_type are rescaled to [0, 1].
+    """
+
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+
+    local = timestamps + get_utc_offsets(timestamps, tz)
+
+    days = (local // MILLIS_PER_DAY).astype('datetime64[D]')
+    seconds = (local - days.astype(np.int64) * MILLIS_PER_DAY) // 1000
+
+    months = days.astype('datetime64[M]')
+    first_days = months.astype('datetime64[D]')
+    month_lengths = ((months + 1).astype('datetime64[D]') - first_days).astype(np.int64)
+
+    month = months.astype(np.int64) % 12
+    day_of_month = (days - first_days).astype(np.int64)
+
+    # 1970-01-01 was a Thursday
+    day_of_week = (days.astype(np.int64) + 3) % 7
+    first_day_of_week = (first_days.astype(np.int64) + 3) % 7
+
+    week_of_month = -((-(day_of_month + 1 + first_day_of_week)) // 7)
+
+    features = {
+        'month': month,
+        'week_of_month': week_of_month,
+        'day_of_month': day_of_month,
+        'day_of_week': day_of_week,
+        'weekday': (day_of_week >= 5).astype(np.int64),
+        'time': seconds / (MILLIS_PER_DAY // 1000 - 1),
+        'time_type': HOUR_SEMANTIC[seconds // 3600],
+    }
+
+    if normalize:
+        features['month'] = month / 11
+        features['week_of_month'] = week_of_month / 4
+        features['day_of_month'] = day_of_month / (month_lengths - 1)
+        features['day_of_week'] = day_of_week / 6
+        features['time_type'] = features['time_type'] / 3
+
+    return features
+
+
+def get_time_matrix(timestamps, normalize, columns, tz=DEFAULT_TZ):
+    """ Returns the time features listed in columns as a float matrix, one row per timestamp.
+    """
+
+    features = get_time_features(timestamps, normalize, tz)
+
+    return np.column_stack([features[column] for column in columns]).astype(np.float64)
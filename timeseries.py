@@ -0,0 +1,153 @@
+import numpy as np
+
+
+class TimeSeries:
+    """ Time-indexed stream: a sorted int64 array of timestamps (millis) and the values recorded at those times.
+    """
+
+    def __init__(self, times, values):
+        self.times = times
+        self.values = values
+        self._cumulative = {}
+        self._mapped = {}
+
+    @classmethod
+    def from_dict(cls, data):
+
+        keys = sorted(data.keys())
+
+        return cls(np.array(keys, dtype=np.int64), [data[k] for k in keys])
+
+    @classmethod
+    def from_arrays(cls, times, values):
+        """ Builds a TimeSeries from parallel sequences (values: a list or an array of rows) in file order. As with
+        from_dict, entries are sorted by time and only the last entry of each time is kept.
+        """
+
+        times = np.asarray(times, dtype=np.int64)
+
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+
+        last = np.ones(len(times), dtype=bool)
+        last[:-1] = times[1:] != times[:-1]
+        order = order[last]
+
+        if isinstance(values, np.ndarray):
+            values = values[order]
+        else:
+            values = [values[i] for i in order.tolist()]
+
+        return cls(times[last], values)
+
+    def __len__(self):
+        return len(self.times)
+
+    def items(self):
+        return zip(self.times.tolist(), self.values)
+
+    def index_at(self, time, max_diff=None):
+        """ Returns the index of the latest entry at or before time, or -1 if there is none (or if it is older than
+        max_diff millis).
+        """
+
+        i = int(np.searchsorted(self.times, time, side='right')) - 1
+
+        if i >= 0 and max_diff is not None and time - self.times[i] > max_diff:
+            i = -1
+
+        return i
+
+    def asof(self, time, max_diff=None):
+        """ Returns the latest value at or before time, or None.
+        """
+
+        i = self.index_at(time, max_diff)
+
+        if i < 0:
+            return None
+
+        return self.values[i]
+
+    def indices_at(self, times, max_diff=None):
+        """ Vectorized index_at: returns, for every element of the times array, the index of the latest entry at or
+        before it (-1 if missing).
+        """
+
+        idx = np.searchsorted(self.times, times, side='right') - 1
+
+        if max_diff is not None and len(self.times) > 0:
+            idx[times - self.times[np.maximum(idx, 0)] > max_diff] = -1
+
+        return idx
+
+    def gather(self, idx, encoder, default=None):
+        """ Returns a 2D float array with one row per element of idx, holding encoder(value) for the referenced
+        entries and encoder(default) where idx is -1. Every distinct entry is encoded only once. With no encoder, the
+        values are feature rows, which are taken as they are (default is the row where idx is -1).
+        """
+
+        if encoder is None:
+            if isinstance(self.values, np.ndarray):
+                if default is None:
+                    return np.asarray(self.values[idx], dtype=np.float64).reshape(len(idx), -1)
+
+                if len(self.values) == 0:
+                    return np.tile(np.asarray(default, dtype=np.float64), (len(idx), 1))
+
+                rows = np.asarray(self.values[np.maximum(idx, 0)], dtype=np.float64).reshape(len(idx), -1)
+                rows[idx < 0] = default
+                return rows
+
+            encoder = list
+
+        uniq, inverse = np.unique(idx, return_inverse=True)
+
+        rows = [encoder(default) if i < 0 else encoder(self.values[i]) for i in uniq.tolist()]
+
+        return np.array(rows, dtype=np.float64).reshape(len(uniq), -1)[inverse.reshape(-1)]
+
+    def mapped(self, function=None):
+        """ Returns the list of function(value) of every entry (the list of the times if None). Computed once per
+        function.
+        """
+
+        if function not in self._mapped:
+            if function is None:
+                self._mapped[function] = self.times.tolist()
+            else:
+                self._mapped[function] = [function(v) for v in self.values]
+
+        return self._mapped[function]
+
+    def cumulative_count(self, predicate=None):
+        """ Returns the prefix sums of the entries satisfying predicate (all entries if None): element i is the number
+        of matching entries among the first i ones. Computed once per predicate.
+        """
+
+        if predicate not in self._cumulative:
+            if predicate is None:
+                matches = np.ones(len(self.values), dtype=np.int64)
+            else:
+                matches = np.fromiter((predicate(v) for v in self.values), dtype=np.int64, count=len(self.values))
+
+            self._cumulative[predicate] = np.concatenate(([0], np.cumsum(matches)))
+
+        return self._cumulative[predicate]
+
+    def count_in_window(self, times, window, predicate=None):
+        """ Returns the number of entries satisfying predicate in [t - window, t], for a single time t or for every
+        element of an array of times.
+        """
+
+        cumulative = self.cumulative_count(predicate)
+
+        end = np.searchsorted(self.times, times, side='right')
+        start = np.searchsorted(self.times, np.subtract(times, window), side='left')
+
+        counts = cumulative[end] - cumulative[start]
+
+        if np.ndim(counts) == 0:
+            return int(counts)
+
+        return counts
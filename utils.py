@@ -1,14 +1,50 @@
 
 def normalize_mac(mac):
-    max_mac = mac_to_int("FF:FF:FF:FF:FF:FF")
-
-    return mac_to_int(mac)/max_mac
+    return MAC_TABLE.normalize(mac)
 
 
 def mac_to_int(mac):
     return int(mac.replace(':', ''), 16)
 
 
+MAX_MAC = mac_to_int("FF:FF:FF:FF:FF:FF")
+
+
+class MacTable:
+    """ Interning table of MAC addresses (BT devices, WiFi BSSIDs, WiFi-P2P devices): every distinct address is
+    parsed once, and its integer and normalized values are cached.
+    """
+
+    def __init__(self):
+        self.ints = {}
+        self.normalized = {}
+
+    def __len__(self):
+        return len(self.ints)
+
+    def to_int(self, mac):
+
+        value = self.ints.get(mac)
+
+        if value is None:
+            value = self.ints[mac] = mac_to_int(mac)
+
+        return value
+
+    def normalize(self, mac):
+
+        value = self.normalized.get(mac)
+
+        if value is None:
+            value = self.normalized[mac] = self.to_int(mac) / MAX_MAC
+
+        return value
+
+
+# Shared by all the device streams of all the users parsed by a process
+MAC_TABLE = MacTable()
+
+
 def int_to_mac(mac):
     ':'.join(format(s, '02x') for s in bytes.fromhex(str(mac)))
 
@@ -78,7 +114,6 @@ WIFI_HEADER = ["wifi_ap_1_bssid", "wifi_ap_1_signal_level", "wifi_ap_1_connected
                "wifi_ap_4_bssid", "wifi_ap_4_signal_level", "wifi_ap_4_connected", "wifi_ap_4_configured",
                "wifi_ap_5_bssid", "wifi_ap_5_signal_level", "wifi_ap_5_connected", "wifi_ap_5_configured"]
 
-'''
 ENVIRONMENT_SENSORS_HEADER = ["sensor_light_min", "sensor_light_max", "sensor_light_mean",
                               "sensor_light_quadratic_mean", "sensor_light_25_percentile", "sensor_light_50_percentile",
                               "sensor_light_75_percentile", "sensor_light_100_percentile"]
@@ -149,14 +184,55 @@ POSITION_SENSORS_HEADER = ["sensor_proximity_min", "sensor_proximity_max", "sens
                            "sensor_proximity_quadratic_mean", "sensor_proximity_25_percentile",
                            "sensor_proximity_50_percentile", "sensor_proximity_75_percentile",
                            "sensor_proximity_100_percentile"]
-'''
 
-def get_dataset_header(google):
+# Sliding-window aggregates (windows.py)
+WINDOW_HEADER = ["window_wifi_distinct_bssids", "window_bt_scan_devices", "window_battery_slope",
+                 "window_screen_on_seconds"]
 
-    header = TIME_HEADER + AUDIO_HEADER + DISPLAY_HEADER + BATTERY_HEADER + ACTIVITY_REC_HEADER \
-             + google.store_categories + BT_CON_HEADER + BT_SCAN_HEADER + CALENDAR_HEADER + MULTIMEDIA_HEADER \
-             + LOCATION_HEADER + WEATHER_HEADER + WIFI_P2P_HEADER + WIFI_HEADER
-             #+ ENVIRONMENT_SENSORS_HEADER + MOTION_SENSORS_HEADER + POSITION_SENSORS_HEADER
+# Feature groups, in dataset order: (name, header, streams). The header of the running apps group depends on the
+# Google Play Store categories (None). streams are the reader.STREAMS the group is computed from. The visible cells
+# group has no features: its examples are only valid with visible cells (leave it out to skip the check).
+FEATURE_GROUPS = [
+    ('time', TIME_HEADER, []),
+    ('audio', AUDIO_HEADER, ['audio_features']),
+    ('display', DISPLAY_HEADER, ['display_status']),
+    ('battery', BATTERY_HEADER, ['battery_features']),
+    ('activity_rec', ACTIVITY_REC_HEADER, ['activity_rec_data']),
+    ('running_apps', None, ['running_apps']),
+    ('bt_conn', BT_CON_HEADER, ['bt_conn']),
+    ('bt_scan', BT_SCAN_HEADER, ['bt_scans']),
+    ('calendar', CALENDAR_HEADER, ['current_events']),
+    ('multimedia', MULTIMEDIA_HEADER, ['multimedia_data']),
+    ('location', LOCATION_HEADER, ['location_data']),
+    ('weather', WEATHER_HEADER, ['weather_info']),
+    ('wifi_p2p', WIFI_P2P_HEADER, ['wifi_p2p']),
+    ('wifi', WIFI_HEADER, ['wifi']),
+    ('visible_cells', [], ['visible_cells']),
+    ('environment_sensors', ENVIRONMENT_SENSORS_HEADER, ['environment_data']),
+    ('motion_sensors', MOTION_SENSORS_HEADER, ['motion_data']),
+    ('position_sensors', POSITION_SENSORS_HEADER, ['position_sensor_data']),
+    ('window', WINDOW_HEADER, ['wifi_devices', 'bt_scan_devices', 'battery_features', 'display_status']),
+]
 
-    return ','.join(header)
+FEATURE_GROUP_NAMES = [group[0] for group in FEATURE_GROUPS]
+
+# The sensors and window groups are not part of the dataset by default
+DEFAULT_FEATURE_GROUPS = [name for name in FEATURE_GROUP_NAMES if not name.endswith('_sensors') and name != 'window']
+
+
+def get_feature_groups_streams(groups):
+    """ Returns the set of reader.STREAMS names the given feature groups need.
+    """
 
+    return set(stream for name, _, streams in FEATURE_GROUPS if name in groups for stream in streams)
+
+
+def get_dataset_header(google, groups=DEFAULT_FEATURE_GROUPS):
+
+    header = []
+
+    for name, group_header, _ in FEATURE_GROUPS:
+        if name in groups:
+            header.extend(google.store_categories if group_header is None else group_header)
+
+    return ','.join(header)
@@ -0,0 +1,204 @@
+from collections import Counter
+
+import numpy as np
+
+from model import is_display_on
+
+'''
+Sliding-window aggregates of the streams over the last WINDOW_MILLIS before every sample time (window group):
+
+    - window_wifi_distinct_bssids       distinct Wi-Fi access points seen in the window
+    - window_bt_scan_devices            distinct Bluetooth devices seen in the window
+    - window_battery_slope              battery level change per hour, between the first and last reading of the window
+    - window_screen_on_seconds          seconds of the window with the display on (state at the window start included)
+
+The sample times are visited in increasing order, and every stream is scanned with two pointers (start and end of the
+window), so every entry enters and leaves the window once per pass: a pass costs O(sample times + entries).
+'''
+
+WINDOW_MILLIS = 10 * 60000
+
+MILLIS_PER_HOUR = 60 * 60 * 1000
+
+
+class SlidingWindow:
+    """ Window [t - length, t] over the entries of a TimeSeries, for increasing times t.
+    """
+
+    def __init__(self, series, length=WINDOW_MILLIS):
+
+        self.times = series.mapped()
+        self.length = length
+
+        # Entries in the window: [start, end)
+        self.start = None
+        self.end = None
+
+    def begin(self, time):
+
+        # First position of the pass: a single binary search
+        self.start = self.end = int(np.searchsorted(self.times, time - self.length, side='left'))
+
+    def advance(self, time):
+        """ Moves the end of the window to time (not before the previous time). Returns (entered, left): the ranges
+        of the entries that entered and left the window (a single entry can be in both).
+        """
+
+        times = self.times
+
+        if self.start is None:
+            self.begin(time)
+
+        end = self.end
+        while end < len(times) and times[end] <= time:
+            end = end + 1
+
+        start = self.start
+        while start < end and times[start] < time - self.length:
+            start = start + 1
+
+        entered = range(self.end, end)
+        left = range(self.start, start)
+
+        self.start = start
+        self.end = end
+
+        return entered, left
+
+
+class DistinctWindow(SlidingWindow):
+    """ Number of distinct keys in the window: keys(value) is the list of keys of an entry (the value itself if None).
+    """
+
+    def __init__(self, series, length=WINDOW_MILLIS, keys=None):
+
+        SlidingWindow.__init__(self, series, length)
+
+        self.keys = series.values if keys is None else series.mapped(keys)
+        self.counts = Counter()
+
+    def distinct(self, time):
+
+        entered, left = self.advance(time)
+
+        counts = self.counts
+
+        for i in entered:
+            counts.update(self.keys[i])
+
+        for i in left:
+            for key in self.keys[i]:
+                counts[key] -= 1
+                if counts[key] == 0:
+                    del counts[key]
+
+        return len(counts)
+
+
+class SlopeWindow(SlidingWindow):
+    """ Change per hour of a value of the entries, between the first and the last entry of the window (0 with less
+    than two entries).
+    """
+
+    def __init__(self, series, length=WINDOW_MILLIS, value=None):
+
+        SlidingWindow.__init__(self, series, length)
+
+        self.values = series.mapped(value)
+
+    def slope(self, time):
+
+        self.advance(time)
+
+        first = self.start
+        last = self.end - 1
+
+        if last <= first or self.times[last] == self.times[first]:
+            return 0.0
+
+        return (self.values[last] - self.values[first]) * MILLIS_PER_HOUR / (self.times[last] - self.times[first])
+
+
+class DurationWindow(SlidingWindow):
+    """ Time (millis) of the window during which the state of the entries satisfies predicate: every entry sets the
+    state until the next one.
+    """
+
+    def __init__(self, series, length=WINDOW_MILLIS, predicate=None):
+
+        SlidingWindow.__init__(self, series, length)
+
+        self.on = series.mapped(predicate)
+
+        # Duration of the "on" segments [times[i], times[i + 1]) with start <= i < end - 1
+        self.inner = 0
+
+    def segment(self, i):
+
+        if self.on[i]:
+            return self.times[i + 1] - self.times[i]
+
+        return 0
+
+    def duration(self, time):
+
+        if self.start is None:
+            self.begin(time)
+
+        start = self.start
+        end = self.end
+
+        self.advance(time)
+
+        # Segments closed by the entries that entered, then segments of the entries that left
+        for i in range(max(end - 1, start), self.end - 1):
+            self.inner = self.inner + self.segment(i)
+
+        for i in range(start, min(self.start, self.end - 1)):
+            self.inner = self.inner - self.segment(i)
+
+        if self.start == self.end:
+            # No entry in the window: state of the last entry before it
+            return self.length if self.start > 0 and self.on[self.start - 1] else 0
+
+        duration = self.inner
+
+        # From the window start to the first entry, and from the last entry to time
+        if self.start > 0 and self.on[self.start - 1]:
+            duration = duration + self.times[self.start] - (time - self.length)
+
+        if self.on[self.end - 1]:
+            duration = duration + time - self.times[self.end - 1]
+
+        return duration
+
+
+def window_features(times, streams, length=WINDOW_MILLIS):
+    """ Returns the matrix of the window features (WINDOW_HEADER) at the sample times (an increasing array), from the
+    streams of reader.load_data.
+    """
+
+    battery_features = streams[1]
+    display_status = streams[7]
+    wifi_devices, bt_scan_devices = streams[-2:]
+
+    wifi_window = DistinctWindow(wifi_devices, length)
+    bt_window = DistinctWindow(bt_scan_devices, length)
+    battery_window = SlopeWindow(battery_features, length, value=battery_level)
+    display_window = DurationWindow(display_status, length, predicate=is_display_on)
+
+    matrix = np.zeros((len(times), 4), dtype=np.float64)
+
+    for i, time in enumerate(times.tolist()):
+        matrix[i, 0] = wifi_window.distinct(time)
+        matrix[i, 1] = bt_window.distinct(time)
+        matrix[i, 2] = battery_window.slope(time)
+        matrix[i, 3] = display_window.duration(time) / 1000
+
+    return matrix
+
+
+# Functions of the stream values (module level, so that TimeSeries.mapped computes them once per stream)
+
+def battery_level(battery):
+    return battery[0]